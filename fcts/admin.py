@@ -322,6 +322,14 @@ class Admin(commands.Cog):
             args.append('1' if ID==486896267788812288 else '2' if ID==436835675304755200 else '3')
             args.append('n' if ctx.bot.get_cog('Events').loop.get_task() is None else 'o')
             args.append('o' if ctx.bot.rss_enabled else 'n')
+        # the bot won't be closed properly, so the waiting data must be saved now
+        if xp := self.bot.get_cog('Xp'):
+            await xp.bdd_flush_xp()
+        if rss := self.bot.get_cog('Rss'):
+            try:
+                await rss.flush_flow_dates()
+            except Exception as e:
+                await self.bot.get_cog('Errors').on_error(e,None)
         self.bot.log.info("Redémarrage du bot")
         os.execl(sys.executable, sys.executable, *args)
 
@@ -409,10 +417,16 @@ class Admin(commands.Cog):
     async def db_reload(self, ctx: MyContext):
         """Reconnecte le bot à la base de donnée"""
         try:
+            # the pending xp must be written before losing the connections
+            if xp := self.bot.get_cog("Xp"):
+                await xp.bdd_flush_xp()
             self.bot.cnx_frm.close()
             self.bot.connect_database_frm()
             self.bot.cnx_xp.close()
             self.bot.connect_database_xp()
+            # the pools replace their broken connections by themselves, they only need to exist
+            if self.bot.db is None:
+                self.bot.connect_database_pools()
             if self.bot.cnx_frm is not None and self.bot.cnx_xp is not None:
                 if utils := self.bot.get_cog("Utilities"):
                     await utils.add_check_reaction(ctx.message)
@@ -18,8 +18,12 @@ class BotStats(commands.Cog):
         self.file = 'bot_stats'
         self.received_events = {'CMD_USE': 0}
         self.commands_uses = dict()
-        self.rss_stats = {'checked': 0, 'messages': 0, 'errors': 0}
+        self.rss_stats = {'checked': 0, 'messages': 0, 'errors': 0, 'skipped_parses': 0, 'saved_bytes': 0}
+        # rss counters are sent every minute: their names differ from the old per-loop totals (rss.checked, rss.messages, rss.errors)
+        self.rss_metrics = {'checked': ('rss.checks', 'checks/min'), 'messages': ('rss.sent_messages', 'messages/min'), 'errors': ('rss.check_errors', 'errors/min'),
+                            'skipped_parses': ('rss.skipped_parses', 'parses/min'), 'saved_bytes': ('rss.saved_bytes', 'bytes/min')}
         self.xp_cards = 0
+        self.xp_flushes = {'count': 0, 'rows': 0, 'time': 0.0}
         self.loop.start() # pylint: disable=no-member
 
     def cog_unload(self):
@@ -59,45 +63,66 @@ class BotStats(commands.Cog):
         now = datetime.fromtimestamp(now-now % 60, tz=timezone.utc)
         # prepare erquests
         query = "INSERT INTO zbot VALUES (%s, %s, %s, %s, %s, %s);"
-        cnx = self.bot.cnx_stats
-        cursor = cnx.cursor(dictionary=True)
+        rows = list()
         try:
             # WS events stats
             for k, v in self.received_events.items():
-                cursor.execute(query, (now, 'wsevent.'+k, v, 0, 'event/min', self.bot.beta))
+                rows.append((now, 'wsevent.'+k, v, 0, 'event/min', self.bot.beta))
                 self.received_events[k] = 0
             # Commands usages stats
             for k, v in self.commands_uses.items():
-                cursor.execute(query, (now, 'cmd.'+k, v, 0, 'cmd/min', self.bot.beta))
+                rows.append((now, 'cmd.'+k, v, 0, 'cmd/min', self.bot.beta))
             self.commands_uses.clear()
             # RSS stats
             for k, v in self.rss_stats.items():
-                cursor.execute(query, (now, 'rss.'+k, v, 0, k, self.bot.beta))
+                name, unit = self.rss_metrics[k]
+                rows.append((now, name, v, 0, unit, self.bot.beta))
+                self.rss_stats[k] = 0
             # XP cards
-            cursor.execute(query, (now, 'xp.generated_cards', self.xp_cards, 0, 'cards/min', self.bot.beta))
+            rows.append((now, 'xp.generated_cards', self.xp_cards, 0, 'cards/min', self.bot.beta))
+            if XpCog := self.bot.get_cog("Xp"):
+                rows.append((now, 'xp.cards_cache_hits', XpCog.cards_cache.hits, 0, 'hits/min', self.bot.beta))
+                rows.append((now, 'xp.cards_cache_misses', XpCog.cards_cache.misses, 0, 'misses/min', self.bot.beta))
+                XpCog.cards_cache.hits = XpCog.cards_cache.misses = 0
+            # Downloaded images cache
+            rows.append((now, 'assets.cache_hits', self.bot.assets_cache.hits, 0, 'hits/min', self.bot.beta))
+            rows.append((now, 'assets.cache_misses', self.bot.assets_cache.misses, 0, 'misses/min', self.bot.beta))
+            self.bot.assets_cache.hits = self.bot.assets_cache.misses = 0
+            # XP database writes
+            rows.append((now, 'xp.flushes', self.xp_flushes['count'], 0, 'flushes/min', self.bot.beta))
+            rows.append((now, 'xp.flushed_rows', self.xp_flushes['rows'], 0, 'rows/min', self.bot.beta))
+            if self.xp_flushes['count'] > 0:
+                latency = round(self.xp_flushes['time']/self.xp_flushes['count']*1000, 3)
+                rows.append((now, 'xp.flush_latency', latency, 1, 'ms', self.bot.beta))
+            self.xp_flushes = {'count': 0, 'rows': 0, 'time': 0.0}
             # Latency - RAM usage - CPU usage
             latency = round(self.bot.latency*1000, 3)
             ram = round(py.memory_info()[0]/2.**30, 3)
             cpu = py.cpu_percent(interval=1)
             if not isinf(latency):
-                cursor.execute(query, (now, 'perf.latency', latency, 1, 'ms', self.bot.beta))
-            cursor.execute(query, (now, 'perf.ram', ram, 1, 'Gb', self.bot.beta))
-            cursor.execute(query, (now, 'perf.cpu', cpu, 1, '%', self.bot.beta))
+                rows.append((now, 'perf.latency', latency, 1, 'ms', self.bot.beta))
+            rows.append((now, 'perf.ram', ram, 1, 'Gb', self.bot.beta))
+            rows.append((now, 'perf.cpu', cpu, 1, '%', self.bot.beta))
             # Unavailable guilds
             unav, total = 0, 0
             for g in self.bot.guilds:
                 unav += g.unavailable
                 total += 1
-            cursor.execute(query, (now, 'guilds.unavailable', round(unav/total, 3)*100, 1, '%', self.bot.beta))
+            rows.append((now, 'guilds.unavailable', round(unav/total, 3)*100, 1, '%', self.bot.beta))
             del unav, total
-            # Push everything
-            cnx.commit()
+            # Push everything in one transaction
+            async with self.bot.db.acquire('stats') as cnx:
+                await cnx.begin()
+                try:
+                    await cnx.executemany(query, rows)
+                    await cnx.commit()
+                except Exception:
+                    await cnx.rollback()
+                    raise
         except mysql.connector.errors.IntegrityError as e: # duplicate primary key
             self.bot.log.warn(f"Stats loop iteration cancelled: {e}")
         except Exception as e:
             await self.bot.get_cog("Errors").on_error(e)
-        # if something goes wrong, we still have to close the cursor
-        cursor.close()
 
     @loop.before_loop
     async def before_printer(self):
@@ -107,11 +132,8 @@ class BotStats(commands.Cog):
 
     async def get_stats(self, variable: str, minutes: int) -> typing.Union[int, float, str, None]:
         """Get the sum of a certain variable in the last X minutes"""
-        cnx = self.bot.cnx_stats
-        cursor = cnx.cursor(dictionary=True)
-        cursor.execute('SELECT variable, SUM(value) as value, type FROM `zbot` WHERE variable = %s AND date BETWEEN (DATE_SUB(UTC_TIMESTAMP(),INTERVAL %s MINUTE)) AND UTC_TIMESTAMP() AND beta=%s', (variable, minutes, self.bot.beta))
-        result: list[dict] = list(cursor)
-        cursor.close()
+        async with self.bot.db.acquire('stats') as cnx:
+            result: list[dict] = await cnx.fetch('SELECT variable, SUM(value) as value, type FROM `zbot` WHERE variable = %s AND date BETWEEN (DATE_SUB(UTC_TIMESTAMP(),INTERVAL %s MINUTE)) AND UTC_TIMESTAMP() AND beta=%s', (variable, minutes, self.bot.beta))
         if len(result) == 0:
             return None
         result = result[0]
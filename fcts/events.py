@@ -76,8 +76,6 @@ class Events(commands.Cog):
             return
         if not self.bot.database_online:
             return
-        cnx = self.bot.cnx_frm
-        cursor = cnx.cursor()
         if isinstance(before, discord.Member):
             b = '' if before.nick is None else before.nick
             a = '' if after.nick is None else after.nick
@@ -87,12 +85,11 @@ class Events(commands.Cog):
         guild = before.guild.id if hasattr(before, 'guild') else 0
         query = "INSERT INTO `usernames_logs` (`user`,`old`,`new`,`guild`,`beta`) VALUES (%(u)s,%(o)s,%(n)s,%(g)s,%(b)s)"
         try:
-            cursor.execute(query, { 'u': before.id, 'o': b, 'n': a, 'g': guild, 'b': self.bot.beta })
-            cnx.commit()
+            async with self.bot.db.acquire() as cnx:
+                await cnx.execute(query, { 'u': before.id, 'o': b, 'n': a, 'g': guild, 'b': self.bot.beta })
         except mysql.connector.errors.IntegrityError as e:
             self.bot.log.warn(e)
             await self.updade_memberslogs_name(before, after, tries+1)
-        cursor.close()
 
     @commands.Cog.listener()
     async def on_user_update(self, before: discord.User, after: discord.User):
@@ -349,21 +346,19 @@ class Events(commands.Cog):
     async def get_events_from_db(self, all: bool=False, IDonly: bool=False):
         """Renvoie une liste de tous les events qui doivent être exécutés"""
         try:
-            cnx = self.bot.cnx_frm
-            cursor = cnx.cursor(dictionary = True)
             if IDonly:
                 query = ("SELECT `ID` FROM `timed`")
             else:
                 query = ("SELECT *, CONVERT_TZ(`begin`, @@session.time_zone, '+00:00') AS `utc_begin` FROM `timed`")
-            cursor.execute(query)
+            async with self.bot.db.acquire() as cnx:
+                rows = await cnx.fetch(query)
             liste = list()
-            for x in cursor:
+            for x in rows:
                 if all:
                     liste.append(x)
                 else:
                     if IDonly or x['begin'].timestamp()+x['duration'] < time.time():
                         liste.append(x)
-            cursor.close()
             if len(liste) > 0:
                 return liste
             else:
@@ -374,12 +369,9 @@ class Events(commands.Cog):
     async def cancel_unmute(self, userID: int, guildID: int):
         """Cancel every automatic unmutes for a member"""
         try:
-            cnx = self.bot.cnx_frm
-            cursor = cnx.cursor(dictionary = True)
             query = 'DELETE FROM `timed` WHERE action="mute" AND guild=%s AND user=%s;'
-            cursor.execute(query, (guildID, userID))
-            cnx.commit()
-            cursor.close()
+            async with self.bot.db.acquire() as cnx:
+                await cnx.execute(query, (guildID, userID))
         except Exception as e:
             await self.bot.get_cog('Errors').on_error(e,None)
 
@@ -441,32 +433,23 @@ class Events(commands.Cog):
             if (t['user']==userID and t['guild']==guildID and t['action']==action and t["channel"]==channelID) and t['action']!='timer':
                 return await self.update_duration(t['ID'],duration)
         data = None if data is None else json.dumps(data)
-        cnx = self.bot.cnx_frm
-        cursor = cnx.cursor()
         query = "INSERT INTO `timed` (`guild`,`channel`,`user`,`action`,`duration`,`message`, `data`) VALUES (%(guild)s,%(channel)s,%(user)s,%(action)s,%(duration)s,%(message)s,%(data)s)"
-        cursor.execute(query, {'guild':guildID, 'channel':channelID, 'user':userID, 'action':action, 'duration':duration, 'message':message, 'data':data})
-        cnx.commit()
-        cursor.close()
+        async with self.bot.db.acquire() as cnx:
+            await cnx.execute(query, {'guild':guildID, 'channel':channelID, 'user':userID, 'action':action, 'duration':duration, 'message':message, 'data':data})
         return True
 
     async def update_duration(self, ID: int, new_duration: int):
         """Modifie la durée d'une tâche"""
-        cnx = self.bot.cnx_frm
-        cursor = cnx.cursor()
         query = ("UPDATE `timed` SET `duration`={} WHERE `ID`={}".format(new_duration,ID))
-        cursor.execute(query)
-        cnx.commit()
-        cursor.close()
+        async with self.bot.db.acquire() as cnx:
+            await cnx.execute(query)
         return True
 
     async def remove_task(self, ID:int):
         """Enlève une tâche exécutée"""
-        cnx = self.bot.cnx_frm
-        cursor = cnx.cursor()
         query = ("DELETE FROM `timed` WHERE `timed`.`ID` = {}".format(ID))
-        cursor.execute(query)
-        cnx.commit()
-        cursor.close()
+        async with self.bot.db.acquire() as cnx:
+            await cnx.execute(query)
         return True
 
     @tasks.loop(seconds=1.0)
@@ -479,9 +462,6 @@ class Events(commands.Cog):
             # Latency usage - every 30s
             if d.second%30 == 0:
                 await self.status_loop(d)
-            # Clear old rank cards - every 20min
-            elif d.minute%20 == 0 and self.bot.database_online:
-                await self.bot.get_cog('Xp').clear_cards()
             # Partners reload - every 7h (start from 1am)
             elif d.hour%7 == 1 and d.hour != self.partner_last_check.hour and self.bot.database_online:
                 await self.partners_loop()
@@ -668,8 +648,6 @@ class Events(commands.Cog):
 
     async def send_sql_statslogs(self):
         "Send some stats about the current bot stats"
-        cnx = self.bot.cnx_frm
-        cursor = cnx.cursor()
         rss_feeds = await self.bot.get_cog("Rss").get_raws_count(True)
         active_rss_feeds = await self.bot.get_cog("Rss").get_raws_count()
         if infoCog := self.bot.get_cog("Info"):
@@ -697,12 +675,11 @@ class Events(commands.Cog):
             int(self.bot.beta),
         )
         try:
-            cursor.execute(query, data)
+            async with self.bot.db.acquire() as cnx:
+                await cnx.execute(query, data)
         except Exception as e:
             await self.bot.get_cog("Errors").senf_err_msg(query)
             raise e
-        cnx.commit()
-        cursor.close()
         emb = self.bot.get_cog("Embeds").Embed(desc='**Stats logs** updated',color=5293283).update_timestamp().set_author(self.bot.user)
         await self.bot.get_cog("Embeds").send([emb],url="loop")
         self.statslogs_last_push = datetime.datetime.now()
@@ -1,5 +1,4 @@
 import asyncio
-import aiohttp
 import json
 import typing
 import json
@@ -12,8 +11,8 @@ from discord.ext import commands
 from discord.ext.commands import Cog
 
 from libs import halloween
-from libs.halloween import convert_image, check_image
 importlib.reload(halloween)
+from libs.halloween import convert_image, check_image
 from utils import zbot, MyContext
 
 
@@ -77,9 +76,14 @@ def _make_check_command(name: str, parent: commands.Group, **kwargs):
                 url = who.avatar_url
 
         old_msg = await ctx.send("Starting check for {}...".format(ctx.author.mention))
-        async with aiohttp.ClientSession() as session:
-            async with session.get(str(url)) as image:
-                r = await check_image(await image.read(), theme, name)
+        async def on_position(position: int):
+            await old_msg.edit(content="Starting check for {}...".format(ctx.author.mention) + (f" (position in queue: {position})" if position else ""))
+        try:
+            r = await self.bot.image_jobs.submit(check_image, await self.bot.fetch_asset(url), theme, name,
+                                                 guild_id=ctx.guild.id if ctx.guild else None, on_position=on_position)
+        except RuntimeError as e:
+            await ctx.send(f"Oops, something went wrong: {e}")
+            return
         answer = "\n".join(
             ["> {}: {}%".format(color["name"], color["ratio"]) for color in r['colors']])
         await ctx.send(f"Results for {ctx.author.mention}:\n"+answer)
@@ -131,10 +135,11 @@ def _make_color_command(name, fmodifier, parent, **kwargs):
             final_modifier = fmodifier
 
         old_msg = await ctx.send("Starting {} for {}...".format(name, ctx.author.mention))
+        async def on_position(position: int):
+            await old_msg.edit(content="Starting {} for {}...".format(name, ctx.author.mention) + (f" (position in queue: {position})" if position else ""))
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(str(url)) as image:
-                    r = await self.bot.loop.run_in_executor(None, convert_image, await image.read(), final_modifier, method, variations)
+            r = await self.bot.image_jobs.submit(convert_image, await self.bot.fetch_asset(url), final_modifier, method, variations, self.max_gif_frames,
+                                                 guild_id=ctx.guild.id if ctx.guild else None, on_position=on_position)
         except RuntimeError as e:
             await ctx.send(f"Oops, something went wrong: {e}")
             return
@@ -149,6 +154,7 @@ class Halloween(Cog):
     def __init__(self, bot: zbot):
         self.bot = bot
         self.file = "halloween"
+        self.max_gif_frames = 100 # animated images are reduced to this number of frames
         self.hourly_reward = [4, 17]
         try:
             with open("halloween-cache.json", "r") as f:
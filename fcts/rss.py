@@ -1,4 +1,5 @@
 from aiohttp.client import ClientSession
+from urllib.parse import urlparse
 from aiohttp import client_exceptions
 from feedparser.util import FeedParserDict
 from utils import zbot, MyContext
@@ -11,14 +12,21 @@ import mysql
 import random
 import typing
 import importlib
+import functools
+import collections
+import json
 import html
+import string
 import socket
-import requests
 import twitter
-import async_timeout
 import feedparser
 from discord.ext import commands, tasks
 from fcts import reloads, args, checks
+from libs.rss_workers import FeedWorkers, fetch_feed
+from libs.rss_scheduler import FlowsScheduler
+from libs.channel_queues import ChannelQueues
+from libs.rss_seen import SeenEntries
+from libs.twitter_client import AsyncTwitter
 # importlib.reload(reloads)
 importlib.reload(args)
 importlib.reload(checks)
@@ -58,42 +66,85 @@ async def can_use_rss(ctx: MyContext):
         return False
     return ctx.channel.permissions_for(ctx.author).manage_guild or await ctx.bot.get_cog("Admin").check_if_admin(ctx)
 
+def normalize_url(url: str) -> str:
+    """Normalize a feed url, so that small differences don't cause several downloads of the same feed"""
+    parsed = urlparse(url.strip())
+    return parsed._replace(scheme=parsed.scheme.lower(), netloc=parsed.netloc.lower(), fragment='').geturl()
+
 class Rss(commands.Cog):
     """Cog which deals with everything related to rss flows. Whether it is to add automatic tracking to a stream, or just to see the latest video released by Discord, it is this cog that will be used."""
 
     def __init__(self, bot: zbot):
         self.bot = bot
-        self.time_loop = 20 # min minutes between two rss loops
-        self.time_between_flows_check = 0.15 # seconds between two rss checks within a loop
+        self.time_loop = 20 # minutes between two checks of a flow with an unknown activity, and between two loop reports
+        self.min_check_interval = 5 # min minutes between two checks of the same flow
+        self.max_check_interval = 240 # max minutes between two checks of the same flow
+        self.loop_tick = 30 # seconds between two searches for flows to check
+        self.max_concurrent_checks = 20 # max flows checked at the same time within a loop
+        self.max_checks_per_host = 4 # max flows of the same website checked at the same time
+        self.flow_check_timeout = 90 # max seconds for checking one flow
+        self.rss_workers = 2 # processes downloading and parsing the feeds, each one for a part of the feeds urls
         self.max_messages = 20 # max messages sent per flow per loop
+        self.max_concurrent_sends = 10 # max rss messages sent at the same time, in different channels
+        self.dates_flush_size = 50 # max flows waiting to save their date and sent entries
+        self.undated_flow_types = {'mc'} # flows whose date is their last check, not their last publication
         
         self.file = "rss"
         self.embed_color = discord.Color(6017876)
         self.loop_processing = False
         self.last_update = None
-        self.twitterAPI = twitter.Api(**bot.others['twitter'], tweet_mode="extended", timeout=15)
+        self.twitterAPI = AsyncTwitter(**bot.others['twitter'], timeout=15)
         self.twitter_over_capacity = False
         self.min_time_between_posts = {
             'web': 120,
             'tw': 15,
             'yt': 120
         }
-        self.cache = dict()
+        self.cache: typing.Optional[typing.Dict[tuple, asyncio.Future]] = None # fetched feeds during a rss loop
+        self.feed_workers = FeedWorkers(workers=self.rss_workers, max_concurrent=self.max_concurrent_checks) # feeds downloading and parsing
+        self.http_validators: typing.Dict[str, dict] = dict() # feed url -> ETag, Last-Modified, size, date and parsed feed of the last response
+        self.scheduler = FlowsScheduler(min_interval=self.min_check_interval*60, default_interval=self.time_loop*60, max_interval=self.max_check_interval*60)
+        try:
+            with open("rss-schedule.json", "r") as f:
+                self.scheduler.load(json.load(f))
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+        self.seen_entries = SeenEntries(size=300) # last entries sent by each flow, saved in the `seen` column of the flows
+        self.loop_lock = asyncio.Lock() # only one batch of flows checked at a time
+        self.pending_flows: typing.Set[int] = set() # flows whose date or sent entries are not saved yet
+        self.pending_deliveries: typing.Counter[int] = collections.Counter() # flow ID -> messages waiting to be sent
+        # every flow of the database, loaded once and kept up to date by add_flow, remove_flow and update_flow
+        self.flows_by_id: typing.Optional[typing.Dict[int, dict]] = None
+        self.guilds_flows: typing.Dict[int, typing.Dict[int, dict]] = dict() # guild ID -> flow ID -> flow
+        self.flows_index_lock = asyncio.Lock()
+        self.seen_column = False # if the flows table can save the sent entries, checked when loading the flows
+        # messages are sent in the background, so checking the flows never waits for Discord
+        self.deliveries = ChannelQueues(self.max_concurrent_sends, on_error=lambda e: self.bot.get_cog('Errors').on_error(e,None))
+        self.last_flows_sync = 0
+        self.loop_report = {'start': time.time(), 'checks': 0, 'flows': set(), 'errors': list()}
         if bot.user is not None:
             self.table = 'rss_flow' if bot.user.id==486896267788812288 else 'rss_flow_beta'
         try:
             self.date = bot.get_cog("TimeUtils").date
         except:
             pass
-        if feedparser.parse('http://twitrss.me/twitter_user_to_rss/?user=Dinnerbone').entries == list():
-            self.twitter_api_url = 'http://twitrss.me/mobile_twitter_to_rss/?user='
-        else:
-            self.twitter_api_url = 'http://twitrss.me/twitter_user_to_rss/?user='
+        self.twitter_api_url = 'http://twitrss.me/twitter_user_to_rss/?user='
+        self.bot.loop.create_task(self.check_twitrss())
         # launch rss loop
         # pylint: disable=no-member
-        self.loop_child.change_interval(minutes=self.time_loop)
+        self.loop_child.change_interval(seconds=self.loop_tick)
         self.loop_child.start()
 
+    async def check_twitrss(self):
+        """Use the mobile version of twitrss if the normal one doesn't work"""
+        try:
+            feeds = await self.feed_parse('http://twitrss.me/twitter_user_to_rss/?user=Dinnerbone', 10, raw=True)
+        except Exception as e:
+            self.bot.log.warn(f"[rss] Unable to check twitrss: {e}")
+            feeds = None
+        if feeds is None or feeds.entries == list():
+            self.twitter_api_url = 'http://twitrss.me/mobile_twitter_to_rss/?user='
+
     @commands.Cog.listener()
     async def on_ready(self):
         self.date = self.bot.get_cog("TimeUtils").date
@@ -102,15 +153,20 @@ class Rss(commands.Cog):
     def cog_unload(self):
         # pylint: disable=no-member
         self.loop_child.cancel()
+        self.feed_workers.close()
+        self.save_loop_state()
+        self.bot.loop.create_task(self.flush_flow_dates())
+        self.bot.loop.create_task(self.twitterAPI.close())
 
     class rssMessage:
-        def __init__(self,bot:zbot,Type,url,title,emojis,date=datetime.datetime.now(),author=None,Format=None,channel=None,retweeted_by=None,image=None):
+        def __init__(self,bot:zbot,Type,url,title,emojis,date=datetime.datetime.now(),author=None,Format=None,channel=None,retweeted_by=None,image=None,entry_key=None):
             self.bot = bot
             self.Type = Type
             self.url = url
             self.title = title
             self.embed = False # WARNING COOKIES WARNINNG
             self.image = image
+            self.entry_key = entry_key # see libs.rss_parsing.entry_key
             if type(date) == datetime.datetime:
                 self.date = date
             elif type(date) == time.struct_time:
@@ -151,26 +207,14 @@ class Rss(commands.Cog):
                 self.embed_data['color'] = flow['embed_color']
             return
 
-        async def fill_mention(self, guild: discord.Guild, roles: typing.List[str], translate):
-            if roles == []:
-                r = await translate(guild.id,"keywords","none")
-            else:
-                r = list()
-                for item in roles:
-                    if item=='':
-                        continue
-                    role = discord.utils.get(guild.roles,id=int(item))
-                    if role is not None:
-                        r.append(role.mention)
-                    else:
-                        r.append(item)
-                self.mentions = r
-            return self
-
-        async def create_msg(self, language, Format=None):
+        async def create_msg(self, language, Format=None, fields: typing.Optional[typing.Set[str]]=None):
+            """Create the message text or embed
+            If the fields used by the format are given, the unused ones are not computed"""
             if Format is None:
                 Format = self.format
-            if not isinstance(self.date,str):
+            if fields is not None and 'date' not in fields:
+                d = None
+            elif not isinstance(self.date,str):
                 d = await self.bot.get_cog("TimeUtils").date(self.date,lang=language,year=False,hour=True,digital=True)
             else:
                 d = self.date
@@ -493,8 +537,8 @@ class Rss(commands.Cog):
                     continue
                 if x['type'] == 'tw' and x['link'].isnumeric():
                     try:
-                        x['link'] = self.twitterAPI.GetUser(user_id=int(x['link'])).screen_name
-                    except twitter.TwitterError as e:
+                        x['link'] = await self.twitterAPI.get_screen_name(int(x['link']))
+                    except (twitter.TwitterError, client_exceptions.ClientError, asyncio.TimeoutError) as e:
                         self.bot.log.debug(f"[rss:askID] Twitter error: {e}")
                 list_of_IDs.append(x['ID'])
                 c = self.bot.get_channel(x['channel'])
@@ -857,7 +901,7 @@ class Rss(commands.Cog):
         """Test if an rss feed is usable"""
         url = url.replace('<','').replace('>','')
         try:
-            feeds = await self.feed_parse(url, 8)
+            feeds = await self.feed_parse(url, 8, raw=True)
             txt = "feeds.keys()\n```py\n{}\n```".format(feeds.keys())
             if 'bozo_exception' in feeds.keys():
                 txt += "\nException ({}): {}".format(feeds['bozo'],str(feeds['bozo_exception']))
@@ -959,8 +1003,8 @@ class Rss(commands.Cog):
         else:
             name = match.group(1)
             try:
-                user = self.twitterAPI.GetUser(screen_name=name)
-            except twitter.TwitterError:
+                user = await self.twitterAPI.get_user(screen_name=name)
+            except (twitter.TwitterError, client_exceptions.ClientError, asyncio.TimeoutError):
                 return None
             return user.id
     
@@ -980,69 +1024,134 @@ class Rss(commands.Cog):
         else:
             return match.group(1)
 
-    async def feed_parse(self, url: str, timeout: int, session: ClientSession = None) -> feedparser.FeedParserDict:
-        """Asynchronous parsing using cool methods"""
-        # if session is provided, we have to not close it
-        _session = session or ClientSession()
-        try:
-            async with async_timeout.timeout(timeout) as cm:
-                async with _session.get(url) as response:
-                    html = await response.text()
-                    headers = response.raw_headers
-        except (client_exceptions.ClientConnectorCertificateError, UnicodeDecodeError, client_exceptions.TooManyRedirects, client_exceptions.ClientConnectorError, client_exceptions.ClientPayloadError):
-            if session is None:
-                await _session.close()
+    async def cached_fetch(self, key: tuple, fetch: typing.Callable[[], typing.Awaitable]):
+        """During a rss loop, run a fetch only once for the same key and share its result with every flow
+        Outside of a loop, the fetch is always done"""
+        if self.cache is None:
+            return await fetch()
+        if key not in self.cache:
+            self.cache[key] = asyncio.ensure_future(fetch())
+        # don't cancel the shared fetch if one flow times out
+        return await asyncio.shield(self.cache[key])
+
+    async def feed_parse(self, url: str, timeout: int, kind: str = 'web', raw: bool = False) -> feedparser.FeedParserDict:
+        """Download and parse a feed, only once per rss loop for the same url
+        Entries are compact records (see libs.rss_parsing), unless `raw` is True"""
+        if raw:
+            return await self._feed_parse(url, timeout, kind, raw)
+        return await self.cached_fetch(('feed', normalize_url(url)), lambda: self._feed_parse(url, timeout, kind))
+
+    async def _feed_parse(self, url: str, timeout: int, kind: str = 'web', raw: bool = False) -> feedparser.FeedParserDict:
+        """Asynchronous parsing using cool methods
+        Feeds are downloaded and parsed by the rss workers processes (see libs.rss_workers), unless `raw` is True
+        The request is conditional: if the feed didn't change, the feed parsed from the last full response is returned again"""
+        if raw:
+            async with ClientSession() as session:
+                result = await fetch_feed(session, url, timeout, {})
+            if result[0] != 'ok':
+                return None if result[0] == 'timeout' else FeedParserDict(entries=[])
+            return await self.bot.loop.run_in_executor(None, lambda: feedparser.parse(result[3], response_headers=result[1]))
+        url_key = normalize_url(url)
+        validators = self.http_validators.get(url_key, {})
+        request_headers = dict()
+        # a 304 response is only useful if we still have the feed it refers to
+        if 'feed' in validators:
+            if validators.get('etag'):
+                request_headers['If-None-Match'] = validators['etag']
+            if validators.get('last_modified'):
+                request_headers['If-Modified-Since'] = validators['last_modified']
+        result = await self.feed_workers.fetch(url, timeout, request_headers, kind, partition_key=url_key)
+        if result[0] == 'error':
             return FeedParserDict(entries=[])
-        except asyncio.exceptions.TimeoutError:
-            if session is None:
-                await _session.close()
+        if result[0] == 'timeout':
             return None
-        except Exception as e:
-            if session is None:
-                await _session.close()
-            raise e
-        if session is None:
-            await _session.close()
-        if cm.expired:
-            # request was cancelled by timeout
-            self.bot.info("[RSS] feed_parse got a timeout")
-            return None
-        headers = {k.decode("utf-8").lower(): v.decode("utf-8") for k, v in headers}
-        return feedparser.parse(html, response_headers=headers)
+        if result[0] == 'invalid_url':
+            raise client_exceptions.InvalidURL(url)
+        if result[0] == 'exception':
+            raise RuntimeError(f"Unable to get the feed {url}: {result[1]}")
+        if result[0] == 'not_modified':
+            if 'feed' not in validators:
+                return FeedParserDict(entries=[])
+            validators['date'] = time.time()
+            if statscog := self.bot.get_cog("BotStats"):
+                statscog.rss_stats['skipped_parses'] += 1
+                statscog.rss_stats['saved_bytes'] += validators.get('size', 0)
+            return validators['feed']
+        _, headers, size, feed = result
+        # every flow and command using this url shares the validators, so they keep the feed they validate
+        if 'etag' in headers or 'last-modified' in headers:
+            self.http_validators[url_key] = {'etag': headers.get('etag'), 'last_modified': headers.get('last-modified'), 'size': size, 'date': time.time(), 'feed': feed}
+        else:
+            self.http_validators.pop(url_key, None)
+        return feed
+
+    def save_loop_state(self):
+        """Save the planned checks, to keep using them after a restart"""
+        # forget the feeds which were not checked for a long time (probably not followed anymore)
+        limit = time.time() - self.max_check_interval*60*2
+        self.http_validators = {url: v for url, v in self.http_validators.items() if v['date'] >= limit}
+        try:
+            with open("rss-schedule.json", "w") as f:
+                json.dump(self.scheduler.dump(), f)
+        except OSError as e:
+            self.bot.log.warn(f"[rss] Unable to save the rss loop state: {e}")
+
+
+    def new_entries(self, flow_id: typing.Optional[int], entries: list, date: datetime.datetime, date_key: typing.Optional[str], min_time: int) -> list:
+        """Get the entries of a feed which were never sent in a flow, newest first
+        Entries older than the flow date are never sent. Flows with a history (see libs.rss_seen) also recognize the other entries by their key,
+        while flows without history stop at the first undated entry
+        The returned entries are only remembered once delivered (see deliver_rss_msg), the other ones right now"""
+        liste = list()
+        known = flow_id is not None and self.seen_entries.known(flow_id)
+        for entry in entries:
+            dated = date_key is not None and entry.get(date_key) is not None
+            if dated and (datetime.datetime(*entry[date_key][:6]) - date).total_seconds() <= min_time:
+                if not known:
+                    break
+                continue
+            if not known:
+                if not dated:
+                    break
+            elif entry.get('key') is None or self.seen_entries.seen(flow_id, entry['key']):
+                continue
+            liste.append(entry)
+        selected = {id(entry) for entry in liste}
+        self.mark_seen(flow_id, [entry for entry in entries if id(entry) not in selected])
+        return liste
 
+    def mark_seen(self, flow_id: typing.Optional[int], entries: list):
+        """Remember some entries of a flow (newest first) as sent, to save them with the flow"""
+        if flow_id is not None and self.seen_entries.add(flow_id, [entry.get('key') for entry in reversed(entries)]):
+            self.pending_flows.add(flow_id)
 
-    async def rss_yt(self, channel: discord.TextChannel, identifiant: str, date=None, session: ClientSession=None):
+    async def rss_yt(self, channel: discord.TextChannel, identifiant: str, date=None, flow_id: int=None):
         if identifiant=='help':
             return await self.bot._(channel,"rss","yt-help")
         url = 'https://www.youtube.com/feeds/videos.xml?channel_id='+identifiant
-        feeds = await self.feed_parse(url, 7, session)
+        feeds = await self.feed_parse(url, 7, kind='yt')
         if feeds is None:
             return await self.bot._(channel,"rss","research-timeout")
         if not feeds.entries:
             url = 'https://www.youtube.com/feeds/videos.xml?user='+identifiant
-            feeds = await self.feed_parse(url, 7, session)
+            feeds = await self.feed_parse(url, 7, kind='yt')
             if feeds is None:
                 return await self.bot._(channel,"rss","nothing")
             if not feeds.entries:
                 return await self.bot._(channel,"rss","nothing")
         if not date:
             feed = feeds.entries[0]
-            img_url = None
-            if 'media_thumbnail' in feed.keys() and len(feed['media_thumbnail']) > 0:
-                img_url = feed['media_thumbnail'][0]['url']
-            obj = self.rssMessage(bot=self.bot,Type='yt',url=feed['link'],title=feed['title'],emojis=self.bot.get_cog('Emojis').customEmojis,date=feed['published_parsed'],author=feed['author'],channel=feed['author'],image=img_url)
+            img_url = feed['image']
+            obj = self.rssMessage(bot=self.bot,Type='yt',url=feed['link'],title=feed['title'],emojis=self.bot.get_cog('Emojis').customEmojis,date=feed['published_parsed'],author=feed['author'],channel=feed['author'],image=img_url,entry_key=feed['key'])
+            self.mark_seen(flow_id, feeds.entries[1:])
             return [obj]
         else:
             liste = list()
-            for feed in feeds.entries:
+            for feed in self.new_entries(flow_id, feeds.entries, date, 'published_parsed', self.min_time_between_posts['yt']):
                 if len(liste)>10:
                     break
-                if 'published_parsed' not in feed or (datetime.datetime(*feed['published_parsed'][:6]) - date).total_seconds() <= self.min_time_between_posts['yt']:
-                    break
-                img_url = None
-                if 'media_thumbnail' in feed.keys() and len(feed['media_thumbnail']) > 0:
-                    img_url = feed['media_thumbnail'][0]['url']
-                obj = self.rssMessage(bot=self.bot,Type='yt',url=feed['link'],title=feed['title'],emojis=self.bot.get_cog('Emojis').customEmojis,date=feed['published_parsed'],author=feed['author'],channel=feed['author'],image=img_url)
+                img_url = feed['image']
+                obj = self.rssMessage(bot=self.bot,Type='yt',url=feed['link'],title=feed['title'],emojis=self.bot.get_cog('Emojis').customEmojis,date=feed['published_parsed'],author=feed['author'],channel=feed['author'],image=img_url,entry_key=feed['key'])
                 liste.append(obj)
             liste.reverse()
             return liste
@@ -1051,9 +1160,9 @@ class Rss(commands.Cog):
     async def get_tw_official(self, nom:str, count:int=None):
         try:
             if nom.isnumeric():
-                timeline = self.twitterAPI.GetUserTimeline(user_id=int(nom), exclude_replies=True, trim_user=True, count=count)
+                timeline = await self.twitterAPI.get_user_timeline(user_id=int(nom), exclude_replies=True, trim_user=True, count=count)
             else:
-                timeline = self.twitterAPI.GetUserTimeline(screen_name=nom, exclude_replies=True, trim_user=True, count=count)
+                timeline = await self.twitterAPI.get_user_timeline(screen_name=nom, exclude_replies=True, trim_user=True, count=count)
             return [x for x in timeline]
         except twitter.error.TwitterError as e:
             if str(e) == "Not authorized.":
@@ -1066,23 +1175,29 @@ class Rss(commands.Cog):
                     return e
                 elif e.message[0]['code'] == 34: # Sorry, that page does not exist - Corresponds with HTTP 404. The specified resource was not found. (can also be an internal problem with Twitter)
                     return e
+                elif e.message[0]['code'] == AsyncTwitter.RATE_LIMIT_CODE:
+                    return e
             except:
                 pass
             await self.bot.get_user(279568324260528128).send("```py\n{}\n``` \n```py\n{}\n```".format(e,e.args))
             return []
-        except requests.exceptions.ConnectionError:
+        except (client_exceptions.ClientError, asyncio.TimeoutError):
             return []
 
     async def rss_tw(self, channel: discord.TextChannel, name: str, date: datetime.datetime=None):
         if name == 'help':
             return await self.bot._(channel,"rss","tw-help")
-        try:
+        async def fetch():
             if isinstance(name, int) or name.isnumeric():
-                posts = self.twitterAPI.GetUserTimeline(user_id=int(name), exclude_replies=True)
-                username = self.twitterAPI.GetUser(user_id=int(name)).screen_name
+                posts = await self.twitterAPI.get_user_timeline(user_id=int(name), exclude_replies=True)
+                # the timeline gives the screen name, so the user is only requested for empty timelines
+                username = await self.twitterAPI.get_screen_name(int(name))
             else:
-                posts = self.twitterAPI.GetUserTimeline(screen_name=name, exclude_replies=True)
+                posts = await self.twitterAPI.get_user_timeline(screen_name=name, exclude_replies=True)
                 username = name
+            return posts, username
+        try:
+            posts, username = await self.cached_fetch(('tw', str(name).lower()), fetch)
         except twitter.error.TwitterError as e:
             if e.message == "Not authorized.":
                 return await self.bot._(channel,"rss","nothing")
@@ -1090,6 +1205,8 @@ class Rss(commands.Cog):
                 return await self.bot._(channel,"rss","nothing")
             if e.message[0]['code'] == 34:
                 return await self.bot._(channel,"rss","nothing")
+            if e.message[0]['code'] in (AsyncTwitter.RATE_LIMIT_CODE, 130): # rate limited or over capacity
+                return e
             raise e
         if not date:
             # lastpost = self.twitterAPI.GetUserTimeline(screen_name=nom,exclude_replies=True,trim_user=True)
@@ -1153,41 +1270,34 @@ class Rss(commands.Cog):
             liste.reverse()
             return liste
 
-    async def rss_twitch(self, channel: discord.TextChannel, nom: str, date: datetime.datetime=None, session: ClientSession=None):
+    async def rss_twitch(self, channel: discord.TextChannel, nom: str, date: datetime.datetime=None, flow_id: int=None):
         url = 'https://twitchrss.appspot.com/vod/'+nom
-        feeds = await self.feed_parse(url, 5, session)
+        feeds = await self.feed_parse(url, 5, kind='twitch')
         if feeds is None:
             return await self.bot._(channel,"rss","research-timeout")
         if feeds.entries==[]:
             return await self.bot._(channel,"rss","nothing")
         if not date:
             feed = feeds.entries[0]
-            r = re.search(r'<img src="([^"]+)" />',feed['summary'])
-            img_url = None
-            if r is not None:
-                img_url = r.group(1)
-            obj = self.rssMessage(bot=self.bot,Type='twitch',url=feed['link'],title=feed['title'],emojis=self.bot.get_cog('Emojis').customEmojis,date=feed['published_parsed'],author=feeds.feed['title'].replace("'s Twitch video RSS",""),image=img_url,channel=nom)
+            img_url = feed['image']
+            obj = self.rssMessage(bot=self.bot,Type='twitch',url=feed['link'],title=feed['title'],emojis=self.bot.get_cog('Emojis').customEmojis,date=feed['published_parsed'],author=feeds.feed['title'].replace("'s Twitch video RSS",""),image=img_url,channel=nom,entry_key=feed['key'])
+            self.mark_seen(flow_id, feeds.entries[1:])
             return [obj]
         else:
             liste = list()
-            for feed in feeds.entries:
+            for feed in self.new_entries(flow_id, feeds.entries, date, 'published_parsed', 0):
                 if len(liste)>10:
                     break
-                if datetime.datetime(*feed['published_parsed'][:6]) <= date:
-                    break
-                r = re.search(r'<img src="([^"]+)" />',feed['summary'])
-                img_url = None
-                if r is not None:
-                    img_url = r.group(1)
-                obj = self.rssMessage(bot=self.bot,Type='twitch',url=feed['link'],title=feed['title'],emojis=self.bot.get_cog('Emojis').customEmojis,date=feed['published_parsed'],author=feeds.feed['title'].replace("'s Twitch video RSS",""),image=img_url,channel=nom)
+                img_url = feed['image']
+                obj = self.rssMessage(bot=self.bot,Type='twitch',url=feed['link'],title=feed['title'],emojis=self.bot.get_cog('Emojis').customEmojis,date=feed['published_parsed'],author=feeds.feed['title'].replace("'s Twitch video RSS",""),image=img_url,channel=nom,entry_key=feed['key'])
                 liste.append(obj)
             liste.reverse()
             return liste
 
-    async def rss_web(self, channel: discord.TextChannel, url: str, date: datetime.datetime=None, session: ClientSession=None):
+    async def rss_web(self, channel: discord.TextChannel, url: str, date: datetime.datetime=None, flow_id: int=None):
         if url == 'help':
             return await self.bot._(channel,"rss","web-help")
-        feeds = await self.feed_parse(url, 9, session)
+        feeds = await self.feed_parse(url, 9)
         if feeds is None:
             return await self.bot._(channel,"rss","research-timeout")
         if 'bozo_exception' in feeds.keys() or len(feeds.entries) == 0:
@@ -1197,14 +1307,16 @@ class Rss(commands.Cog):
             if i in feeds.entries[0].keys() and feeds.entries[0][i] is not None:
                 published = i
                 break
-        if published is not None and len(feeds.entries) > 1:
+        # the parsed feed can be shared with other flows, so we work on a copy of its entries
+        entries = list(feeds.entries)
+        if published is not None and len(entries) > 1:
             try:
-                while (len(feeds.entries) > 1)  and (feeds.entries[1][published] is not None) and (feeds.entries[0][published] < feeds.entries[1][published]):
-                    del feeds.entries[0]
+                while (len(entries) > 1)  and (entries[1][published] is not None) and (entries[0][published] < entries[1][published]):
+                    del entries[0]
             except KeyError:
                 pass
-        if not date or published not in ['published_parsed','updated_parsed']:
-            feed = feeds.entries[0]
+        if not date:
+            feed = entries[0]
             if published is None:
                 datz = 'Unknown'
             else:
@@ -1229,10 +1341,7 @@ class Rss(commands.Cog):
                 title = feeds['title']
             else:
                 title = '?'
-            img = None
-            r = re.search(r'(http(s?):)([/|.|\w|\s|-])*\.(?:jpe?g|gif|png|webp)', str(feed))
-            if r is not None:
-                img = r.group(0)
+            img = feed['image']
             obj = self.rssMessage(
                 bot=self.bot,
                 Type='web',
@@ -1242,17 +1351,20 @@ class Rss(commands.Cog):
                 date=datz,
                 author=author,
                 channel=feeds.feed['title'] if 'title' in feeds.feed.keys() else '?',
-                image=img)
+                image=img,
+                entry_key=feed['key'])
+            # a new flow only sends its last entry
+            self.mark_seen(flow_id, [x for x in feeds.entries if x is not feed])
             return [obj]
-        else: # published in ['published_parsed','updated_parsed']
+        else:
             liste = list()
-            for feed in feeds.entries:
+            # undated entries can only be recognized by their key
+            date_key = published if published in ['published_parsed','updated_parsed'] else None
+            for feed in self.new_entries(flow_id, entries, date, date_key, self.min_time_between_posts['web']):
                 if len(liste)>10:
                     break
                 try:
-                    datz = feed[published]
-                    if feed[published] is None or (datetime.datetime(*feed[published][:6]) - date).total_seconds() < self.min_time_between_posts['web']:
-                        break
+                    datz = feed.get(published) or 'Unknown'
                     if 'link' in feed.keys():
                         l = feed['link']
                     elif 'link' in feeds.keys():
@@ -1273,10 +1385,7 @@ class Rss(commands.Cog):
                         title = feeds['title']
                     else:
                         title = '?'
-                    img = None
-                    r = re.search(r'(http(s?):)([/|.|\w|\s|-])*\.(?:jpe?g|gif|png|webp)', str(feed))
-                    if r is not None:
-                        img = r.group(0)
+                    img = feed['image']
                     obj = self.rssMessage(
                         bot=self.bot,
                         Type='web',
@@ -1286,7 +1395,8 @@ class Rss(commands.Cog):
                         date=datz,
                         author=author,
                         channel=feeds.feed['title'] if 'title' in feeds.feed.keys() else '?',
-                        image=img)
+                        image=img,
+                        entry_key=feed['key'])
                     liste.append(obj)
                 except:
                     pass
@@ -1294,27 +1404,26 @@ class Rss(commands.Cog):
             return liste
 
 
-    async def rss_deviant(self, guild: discord.Guild, nom: str, date: datetime.datetime=None, session: ClientSession=None):
+    async def rss_deviant(self, guild: discord.Guild, nom: str, date: datetime.datetime=None, flow_id: int=None):
         url = 'https://backend.deviantart.com/rss.xml?q=gallery%3A'+nom
-        feeds = await self.feed_parse(url, 5, session)
+        feeds = await self.feed_parse(url, 5, kind='deviant')
         if feeds is None:
             return await self.bot._(guild,"rss","research-timeout")
         if feeds.entries==[]:
             return await self.bot._(guild,"rss","nothing")
         if not date:
             feed = feeds.entries[0]
-            img_url = feed['media_content'][0]['url']
+            img_url = feed['image']
             title = re.search(r"DeviantArt: ([^ ]+)'s gallery",feeds.feed['title']).group(1)
-            obj = self.rssMessage(bot=self.bot,Type='deviant',url=feed['link'],title=feed['title'],emojis=self.bot.get_cog('Emojis').customEmojis,date=feed['published_parsed'],author=title,image=img_url)
+            obj = self.rssMessage(bot=self.bot,Type='deviant',url=feed['link'],title=feed['title'],emojis=self.bot.get_cog('Emojis').customEmojis,date=feed['published_parsed'],author=title,image=img_url,entry_key=feed['key'])
+            self.mark_seen(flow_id, feeds.entries[1:])
             return [obj]
         else:
             liste = list()
-            for feed in feeds.entries:
-                if datetime.datetime(*feed['published_parsed'][:6]) <= date:
-                    break
-                img_url = feed['media_content'][0]['url']
+            for feed in self.new_entries(flow_id, feeds.entries, date, 'published_parsed', 0):
+                img_url = feed['image']
                 title = re.search(r"DeviantArt: ([^ ]+)'s gallery",feeds.feed['title']).group(1)
-                obj = self.rssMessage(bot=self.bot,Type='deviant',url=feed['link'],title=feed['title'],emojis=self.bot.get_cog('Emojis').customEmojis,date=feed['published_parsed'],author=title,image=img_url)
+                obj = self.rssMessage(bot=self.bot,Type='deviant',url=feed['link'],title=feed['title'],emojis=self.bot.get_cog('Emojis').customEmojis,date=feed['published_parsed'],author=title,image=img_url,entry_key=feed['key'])
                 liste.append(obj)
             liste.reverse()
             return liste
@@ -1339,114 +1448,154 @@ class Rss(commands.Cog):
             numb = int('66'+numb)
         return numb
 
-    def connect(self):
-        return mysql.connector.connect(user=self.bot.database_keys['user'],password=self.bot.database_keys['password'],host=self.bot.database_keys['host'],database=self.bot.database_keys['database'])
+    async def get_flows_index(self) -> typing.Dict[int, dict]:
+        """Get every flow by ID, loading them from the database the first time"""
+        if self.flows_by_id is None:
+            async with self.flows_index_lock:
+                if self.flows_by_id is None:
+                    query = "SELECT * FROM `{}`".format(self.table)
+                    async with self.bot.db.acquire() as cnx:
+                        # the sent entries of each flow are saved with it (see flush_flow_dates and migrations/001_rss_flow_seen.sql)
+                        self.seen_column = len(await cnx.fetch("SHOW COLUMNS FROM `{}` LIKE 'seen'".format(self.table))) > 0
+                        if not self.seen_column:
+                            self.bot.log.error(f"[rss] The table {self.table} has no `seen` column (see migrations/001_rss_flow_seen.sql): sent entries won't be saved")
+                        liste = await cnx.fetch(query)
+                    self.guilds_flows = dict()
+                    for flow in liste:
+                        if seen := flow.pop('seen', None):
+                            self.seen_entries.load(int(flow['ID']), seen)
+                        self.guilds_flows.setdefault(int(flow['guild']), dict())[int(flow['ID'])] = flow
+                    self.flows_by_id = {int(flow['ID']): flow for flow in liste}
+        return self.flows_by_id
 
     async def get_flow(self, ID: int):
-        cnx = self.bot.cnx_frm
-        cursor = cnx.cursor(dictionary = True)
-        query = ("SELECT * FROM `{}` WHERE `ID`='{}'".format(self.table,ID))
-        cursor.execute(query)
-        liste = list()
-        for x in cursor:
-            liste.append(x)
-        cursor.close()
-        return liste
+        try:
+            flow = (await self.get_flows_index()).get(int(ID))
+        except ValueError:
+            return []
+        # copies, so that the index can't be modified by mistake
+        return [] if flow is None else [dict(flow)]
 
     async def get_guild_flows(self, guildID: int):
         """Get every flow of a guild"""
-        cnx = self.bot.cnx_frm
-        cursor = cnx.cursor(dictionary = True)
-        query = ("SELECT * FROM `{}` WHERE `guild`='{}'".format(self.table,guildID))
-        cursor.execute(query)
-        liste = list()
-        for x in cursor:
-            liste.append(x)
-        cursor.close()
-        return liste
+        await self.get_flows_index()
+        return [dict(flow) for flow in self.guilds_flows.get(int(guildID), {}).values()]
 
     async def add_flow(self, guildID:int, channelID:int, _type:str, link:str):
         """Add a flow in the database"""
-        cnx = self.bot.cnx_frm
-        cursor = cnx.cursor()
         ID = await self.create_id(_type)
         if _type == 'mc':
             form = ''
         else:
             form = await self.bot._(guildID, "rss", _type+"-default-flow")
         query = "INSERT INTO `{}` (`ID`, `guild`,`channel`,`type`,`link`,`structure`) VALUES (%(i)s,%(g)s,%(c)s,%(t)s,%(l)s,%(f)s)".format(self.table)
-        cursor.execute(query, { 'i': ID, 'g': guildID, 'c': channelID, 't': _type, 'l': link, 'f': form })
-        cnx.commit()
-        cursor.close()
+        async with self.bot.db.acquire() as cnx:
+            await cnx.execute(query, { 'i': ID, 'g': guildID, 'c': channelID, 't': _type, 'l': link, 'f': form })
+            # the database sets the default values of the other fields
+            flow = await cnx.fetchone("SELECT * FROM `{}` WHERE `ID`=%s".format(self.table), (ID,))
+        if self.flows_by_id is not None and flow is not None:
+            flow.pop('seen', None)
+            self.flows_by_id[int(flow['ID'])] = flow
+            self.guilds_flows.setdefault(int(flow['guild']), dict())[int(flow['ID'])] = flow
         return ID
 
     async def remove_flow(self, ID: int):
         """Remove a flow from the database"""
         if type(ID)!=int:
             raise ValueError
-        cnx = self.bot.cnx_frm
-        cursor = cnx.cursor()
         query = ("DELETE FROM `{}` WHERE `ID`='{}'".format(self.table,ID))
-        cursor.execute(query)
-        cnx.commit()
-        cursor.close()
+        async with self.bot.db.acquire() as cnx:
+            await cnx.execute(query)
+        self.seen_entries.forget(ID)
+        if self.flows_by_id is not None and (flow := self.flows_by_id.pop(ID, None)) is not None:
+            self.guilds_flows.get(int(flow['guild']), {}).pop(ID, None)
         return True
 
     async def get_all_flows(self):
-        """Get every flow of the database"""
-        cnx = self.bot.cnx_frm
-        cursor = cnx.cursor(dictionary = True)
-        query = ("SELECT * FROM `{}` WHERE `guild` in ({})".format(self.table,','.join(["'{}'".format(x.id) for x in self.bot.guilds])))
-        cursor.execute(query)
-        liste = list()
-        for x in cursor:
-            liste.append(x)
-        cursor.close()
-        return liste
+        """Get every flow of the guilds the bot is in"""
+        await self.get_flows_index()
+        return [dict(flow) for guild in self.bot.guilds for flow in self.guilds_flows.get(guild.id, {}).values()]
     
     async def get_raws_count(self, get_disabled:bool=False):
         """Get the number of rss feeds"""
-        cnx = self.bot.cnx_frm
-        cursor = cnx.cursor()
-        query = "SELECT COUNT(*) FROM `{}`".format(self.table)
-        if not get_disabled:
-            query += " WHERE `guild` in (" + ','.join(["'{}'".format(x.id) for x in self.bot.guilds]) + ")"
-        cursor.execute(query)
-        t = list(cursor)[0][0]
-        cursor.close()
-        return t
+        index = await self.get_flows_index()
+        if get_disabled:
+            return len(index)
+        return sum(len(self.guilds_flows.get(guild.id, {})) for guild in self.bot.guilds)
 
     async def update_flow(self, ID: int, values=[(None,None)]):
         if self.bot.zombie_mode:
             return
-        cnx = self.bot.cnx_frm
-        cursor = cnx.cursor()
-        v = list()
-        for x in values:
-            if isinstance(x[1],(bool,int)):
-                v.append("""`{x[0]}`={x[1]}""".format(x=x))
-            elif isinstance(x[1],(datetime.datetime,float)) or x[0]=='roles':
-                v.append("""`{x[0]}`=\"{x[1]}\"""".format(x=x))
-            else:
-                v.append("`{}`=\"{}\"".format(x[0],x[1].replace('"','\\"')))
-        query = """UPDATE `{t}` SET {v} WHERE `ID`={id}""".format(t=self.table,v=",".join(v),id=ID)
-        cursor.execute(query)
-        cnx.commit()
-        cursor.close()
-
-    async def send_rss_msg(self, obj: "rssMessage", channel: discord.TextChannel, roles: typing.List[str], send_stats):
+        query = "UPDATE `{t}` SET {v} WHERE `ID`=%s".format(t=self.table, v=",".join(["`{}`=%s".format(x[0]) for x in values]))
+        async with self.bot.db.acquire() as cnx:
+            await cnx.execute(query, [x[1] for x in values] + [ID])
+        if self.flows_by_id is not None and (flow := self.flows_by_id.get(int(ID))) is not None:
+            flow.update(values)
+
+    async def queue_flow_update(self, ID: int, date: typing.Optional[datetime.datetime] = None):
+        """Remember the date of the last sent entry of a flow, to save it with the other ones and the sent entries at the end of the loop"""
+        # the next check must not wait for the database to know this date
+        if date is not None and self.flows_by_id is not None and (flow := self.flows_by_id.get(int(ID))) is not None:
+            # messages of a flow can be delivered in any order after a failure
+            if not isinstance(flow['date'], datetime.datetime) or date > flow['date']:
+                flow['date'] = date
+        self.pending_flows.add(ID)
+        if len(self.pending_flows) >= self.dates_flush_size:
+            await self.flush_flow_dates()
+
+    async def flush_flow_dates(self):
+        """Save the date and the sent entries of every waiting flow in one transaction"""
+        if len(self.pending_flows) == 0 or self.bot.zombie_mode or self.flows_by_id is None:
+            return
+        pending, self.pending_flows = self.pending_flows, set()
+        if self.seen_column:
+            query = "UPDATE `{}` SET `date`=%s, `seen`=%s WHERE `ID`=%s".format(self.table)
+            rows = [(self.flows_by_id[ID]['date'], self.seen_entries.dump(ID), ID) for ID in pending if ID in self.flows_by_id]
+        else:
+            # without the column, the sent entries are only remembered until the next restart
+            query = "UPDATE `{}` SET `date`=%s WHERE `ID`=%s".format(self.table)
+            rows = [(self.flows_by_id[ID]['date'], ID) for ID in pending if ID in self.flows_by_id]
+        try:
+            async with self.bot.db.acquire() as cnx:
+                await cnx.begin()
+                try:
+                    await cnx.executemany(query, rows)
+                    await cnx.commit()
+                except Exception:
+                    await cnx.rollback()
+                    raise
+        except Exception:
+            # the index keeps the latest values, which will be saved next time
+            self.pending_flows |= pending
+            raise
+
+    async def get_render_context(self, guild: discord.Guild, flow: dict) -> dict:
+        """Resolve once per flow check what every message of the flow needs: language, mentions and format
+        The context also tells if a message of this check failed to be sent (see deliver_rss_msg)
+        During a rss loop, the language is also shared by every flow of the guild"""
+        language = await self.cached_fetch(('lang', guild.id), lambda: self.bot._(guild,"current_lang","current"))
+        mentions = list()
+        for item in flow['roles'].split(';'):
+            if item == '':
+                continue
+            role = guild.get_role(int(item))
+            mentions.append(item if role is None else role.mention)
+        text_format = flow['structure'].replace('\\n','\n')
+        try:
+            fields = {re.split(r'[.\[]', field)[0] for _, field, _, _ in string.Formatter().parse(text_format) if field is not None}
+        except ValueError:
+            # invalid format: let create_msg raise the error
+            fields = None
+        return {'language': language, 'mentions': mentions, 'format': text_format, 'fields': fields, 'failed': False}
+
+    async def send_rss_msg(self, obj: "rssMessage", channel: discord.TextChannel, context: dict, send_stats) -> bool:
+        """Send a rss message, with the render context of its flow (see get_render_context)
+        Return False if the message should be sent again later (Discord or network issue)"""
         if channel is not None:
-            t = await obj.create_msg(await self.bot._(channel.guild,"current_lang","current"))
-            mentions = list()
-            for item in roles:
-                if item=='':
-                    continue
-                role = discord.utils.get(channel.guild.roles,id=int(item))
-                if role is not None:
-                    mentions.append(role)
+            t = await obj.create_msg(context['language'], fields=context['fields'])
             try:
                 if self.bot.zombie_mode:
-                    return
+                    return True
                 if isinstance(t,(self.bot.get_cog('Embeds').Embed,discord.Embed)):
                     await channel.send(" ".join(obj.mentions), embed=t, allowed_mentions=discord.AllowedMentions(everyone=False, roles=True))
                 else:
@@ -1454,14 +1603,33 @@ class Rss(commands.Cog):
                 if send_stats:
                     if statscog := self.bot.get_cog("BotStats"):
                         statscog.rss_stats['messages'] += 1
+            except (discord.DiscordServerError, client_exceptions.ClientError, asyncio.TimeoutError, OSError) as e:
+                self.bot.log.info("[send_rss_msg] Cannot send message on channel {}, will retry: {}".format(channel.id,e))
+                return False
             except discord.HTTPException as e:
                 self.bot.log.info("[send_rss_msg] Cannot send message on channel {}: {}".format(channel.id,e))
                 await self.bot.get_cog("Errors").on_error(e)
                 await self.bot.get_cog("Errors").senf_err_msg(str(t.to_dict()) if hasattr(t, "to_dict") else str(t))
             except Exception as e:
                 self.bot.log.info("[send_rss_msg] Cannot send message on channel {}: {}".format(channel.id,e))
+        return True
 
-    async def check_flow(self, flow: dict, session: ClientSession = None, send_stats: bool=False):
+    async def deliver_rss_msg(self, obj: "rssMessage", channel: discord.TextChannel, context: dict, flow_id: int, send_stats: bool):
+        """Send a rss message from the deliveries queue, then remember its entry as sent
+        After a failure, the next messages of the same check are kept for the next check of the flow"""
+        try:
+            if context['failed'] or not await self.send_rss_msg(obj, channel, context, send_stats):
+                context['failed'] = True
+                return
+            if obj.entry_key is not None:
+                self.seen_entries.add(flow_id, [obj.entry_key])
+            await self.queue_flow_update(flow_id, obj.date if isinstance(obj.date, datetime.datetime) else datetime.datetime.utcnow())
+        finally:
+            self.pending_deliveries[flow_id] -= 1
+            if self.pending_deliveries[flow_id] <= 0:
+                del self.pending_deliveries[flow_id]
+
+    async def check_flow(self, flow: dict, send_stats: bool=False):
         try:
             guild = self.bot.get_guild(flow['guild'])
             if guild is None:
@@ -1471,35 +1639,41 @@ class Rss(commands.Cog):
             if chan is None:
                 self.bot.log.info("[send_rss_msg] Cannot send message on channel {} (unknown channel)".format(flow['channel']))
                 return True
-            if flow['link'] in self.cache.keys():
-                objs = self.cache[flow['link']]
+            # the new entries are only known once the previous ones are delivered
+            if self.pending_deliveries[flow['ID']] > 0:
+                return None
+            # feeds are downloaded and parsed once per loop (see feed_parse), but each flow keeps its own date and format
+            funct = getattr(self, f"rss_{flow['type']}")
+            if flow["type"] == "tw":
+                objs = await funct(chan,flow['link'], flow['date'])
             else:
-                funct = getattr(self, f"rss_{flow['type']}")
-                if flow["type"] == "tw":
-                    objs = await funct(chan,flow['link'], flow['date'])
-                else:
-                    objs = await funct(chan,flow['link'], flow['date'], session=session)
-                if isinstance(objs,twitter.error.TwitterError):
-                    self.twitter_over_capacity = True
-                    self.bot.log.warn("[send_rss_msg] Twitter over capacity detected")
-                    return False
-                flow['link'] = objs
+                objs = await funct(chan,flow['link'], flow['date'], flow_id=flow['ID'])
+            if isinstance(objs,twitter.error.TwitterError):
+                self.twitter_over_capacity = True
+                if objs.message[0]['code'] == AsyncTwitter.RATE_LIMIT_CODE:
+                    # not an error: the flow will be checked again once the limit is reset
+                    self.bot.log.info("[send_rss_msg] Twitter rate limit reached")
+                    return None
+                self.bot.log.warn("[send_rss_msg] Twitter over capacity detected")
+                return False
             if isinstance(objs,twitter.TwitterError):
                 await self.bot.get_user(279568324260528128).send(f"[send_rss_msg] twitter error dans `await check_flow(): {objs}`")
                 raise objs
             if isinstance(objs,(str,type(None),int)) or len(objs) == 0:
                 return True
             elif type(objs) == list:
+                self.scheduler.add_publications(flow['ID'], [t for t in (self.date_timestamp(o.date, flow['type']) for o in objs) if t is not None])
+                context = await self.get_render_context(guild, flow)
                 for o in objs[:self.max_messages]:
                     # if we can't post messages: abort
                     if not chan.permissions_for(guild.me).send_messages:
                         return True
-                    o.format = flow['structure']
+                    o.format = context['format']
                     o.embed = flow['use_embed']
                     o.fill_embed_data(flow)
-                    await o.fill_mention(guild, flow['roles'].split(';'), self.bot._)
-                    await self.send_rss_msg(o, chan, flow['roles'].split(';'), send_stats)
-                await self.update_flow(flow['ID'], [('date', o.date)],)
+                    o.mentions = context['mentions']
+                    self.pending_deliveries[flow['ID']] += 1
+                    self.deliveries.put(chan.id, functools.partial(self.deliver_rss_msg, o, chan, context, flow['ID'], send_stats))
                 return True
             else:
                 return True
@@ -1509,7 +1683,71 @@ class Rss(commands.Cog):
             return False
 
 
+    def get_flow_host(self, flow: dict) -> str:
+        """Get the website which will be requested to check a flow, to limit the simultaneous requests to one host"""
+        if flow['type'] == 'web':
+            return urlparse(flow['link']).netloc.lower() or flow['link']
+        return flow['type']
+
+    async def check_flow_limited(self, flow: dict, semaphore: asyncio.Semaphore, hosts_semaphores: typing.Dict[str, asyncio.Semaphore], send_stats: bool) -> bool:
+        """Check one flow when a slot is available, both globally and for its host
+        Return True if the flow was successfully checked, False on error, None if it was skipped"""
+        # waiting for the host first, so that one busy host can't take every global slot
+        async with hosts_semaphores[self.get_flow_host(flow)], semaphore:
+            if flow['type'] == 'tw' and self.twitter_over_capacity:
+                return None
+            try:
+                if flow['type'] == 'mc':
+                    await asyncio.wait_for(self.bot.get_cog('Minecraft').check_flow(flow, send_stats=send_stats), self.flow_check_timeout)
+                    return True
+                return await asyncio.wait_for(self.check_flow(flow, send_stats=send_stats), self.flow_check_timeout)
+            except asyncio.TimeoutError:
+                self.bot.log.warn(f"[rss] Flow {flow['ID']} took more than {self.flow_check_timeout}s to be checked")
+                return False
+            except Exception as e:
+                await self.bot.get_cog('Errors').on_error(e,None)
+                return False
+
+    def date_timestamp(self, date: datetime.datetime, flow_type: str) -> typing.Optional[float]:
+        """Convert an entry date into a timestamp
+        Feeds dates are in UTC, while tweets dates are in local time"""
+        if not isinstance(date, datetime.datetime):
+            return None
+        if flow_type == 'tw':
+            return date.timestamp()
+        return date.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+    async def check_flows(self, liste: typing.List[dict], send_stats: bool) -> typing.List[typing.Optional[bool]]:
+        """Check a batch of flows, downloading each feed only once, then plan their next check
+        Return the result of each check (see check_flow_limited)"""
+        self.cache = dict()
+        semaphore = asyncio.Semaphore(self.max_concurrent_checks)
+        hosts_semaphores = collections.defaultdict(lambda: asyncio.Semaphore(self.max_checks_per_host))
+        results = [None] * len(liste)
+        try:
+            results = await asyncio.gather(*[self.check_flow_limited(flow, semaphore, hosts_semaphores, send_stats) for flow in liste])
+        finally:
+            self.cache = None
+            # even if the batch was cancelled, every flow needs a next check
+            for flow, result in zip(liste, results):
+                if flow['type'] in self.undated_flow_types:
+                    self.scheduler.reschedule(flow['ID'], result, learn=False)
+                else:
+                    self.scheduler.reschedule(flow['ID'], result, self.date_timestamp(flow['date'], flow['type']))
+        try:
+            await self.flush_flow_dates()
+        except Exception as e:
+            await self.bot.get_cog('Errors').on_error(e,None)
+        self.bot.get_cog('Minecraft').flows = dict()
+        self.twitter_over_capacity = False
+        if send_stats:
+            if statscog := self.bot.get_cog("BotStats"):
+                statscog.rss_stats['checked'] += results.count(True)
+                statscog.rss_stats['errors'] += results.count(False)
+        return results
+
     async def main_loop(self, guildID: int=None):
+        """Check every flow (or every flow of a guild) right now, without waiting for their planned check"""
         if not self.bot.rss_enabled:
             return
         t = time.time()
@@ -1522,34 +1760,16 @@ class Rss(commands.Cog):
         else:
             self.bot.log.info(f"Check RSS lancé pour le serveur {guildID}")
             liste = await self.get_guild_flows(guildID)
-        check = 0
-        errors = []
-        if guildID is None:
-            if statscog := self.bot.get_cog("BotStats"):
-                statscog.rss_stats['messages'] = 0
-        session = ClientSession()
-        for flow in liste:
-            try:
-                if flow['type'] == 'tw' and self.twitter_over_capacity:
-                    continue
-                if flow['type'] == 'mc':
-                    await self.bot.get_cog('Minecraft').check_flow(flow, send_stats=(guildID is None))
-                    check +=1
-                else:
-                    if await self.check_flow(flow, session, send_stats=(guildID is None)):
-                        check += 1
-                    else:
-                        errors.append(flow['ID'])
-            except Exception as e:
-                await self.bot.get_cog('Errors').on_error(e,None)
-            await asyncio.sleep(self.time_between_flows_check)
-        await session.close()
-        self.bot.get_cog('Minecraft').flows = dict()
+        try:
+            async with self.loop_lock:
+                results = await self.check_flows(liste, guildID is None)
+        finally:
+            if guildID is None:
+                self.loop_processing = False
+        self.save_loop_state()
+        check = results.count(True)
+        errors = [flow['ID'] for flow, result in zip(liste, results) if result is False]
         d = ["**RSS loop done** in {}s ({}/{} flows)".format(round(time.time()-t,3),check,len(liste))]
-        if guildID is None:
-            if statscog := self.bot.get_cog("BotStats"):
-                statscog.rss_stats['checked'] = check
-                statscog.rss_stats['errors'] = len(errors)
         if len(errors) > 0:
             d.append('{} errors: {}'.format(len(errors),' '.join([str(x) for x in errors])))
         emb = self.bot.get_cog("Embeds").Embed(desc='\n'.join(d),color=1655066).update_timestamp().set_author(self.bot.user)
@@ -1557,20 +1777,51 @@ class Rss(commands.Cog):
         self.bot.log.debug(d[0])
         if len(errors) > 0:
             self.bot.log.warn("[Rss loop] "+d[1])
-        if guildID is None:
-            self.loop_processing = False
-        self.twitter_over_capacity = False
-        self.cache = dict()
 
-    @tasks.loop(minutes=20)
+    async def check_due_flows(self):
+        """Check the flows whose planned check date is reached
+        The flows list is read again when some flows are due, or every `time_loop` minutes to find the new ones"""
+        next_check = self.scheduler.next_check()
+        if (next_check is None or next_check > time.time()) and self.last_flows_sync > time.time() - self.time_loop*60:
+            return
+        async with self.loop_lock:
+            liste = await self.get_all_flows()
+            self.scheduler.sync(flow['ID'] for flow in liste)
+            self.last_flows_sync = time.time()
+            due = set(self.scheduler.pop_due())
+            liste = [flow for flow in liste if flow['ID'] in due]
+            if len(liste) == 0:
+                return
+            results = await self.check_flows(liste, True)
+        self.loop_report['checks'] += results.count(True)
+        self.loop_report['flows'].update(flow['ID'] for flow in liste)
+        self.loop_report['errors'] += [flow['ID'] for flow, result in zip(liste, results) if result is False]
+
+    async def send_loop_report(self):
+        """Send a summary of the flows checks done since the last report"""
+        report, self.loop_report = self.loop_report, {'start': time.time(), 'checks': 0, 'flows': set(), 'errors': list()}
+        d = ["**RSS loop**: {} checks of {} flows in {} min, {} messages waiting to be sent".format(report['checks'], len(report['flows']), round((time.time()-report['start'])/60), self.deliveries.pending())]
+        if len(report['errors']) > 0:
+            d.append('{} errors: {}'.format(len(report['errors']),' '.join([str(x) for x in report['errors']])))
+        emb = self.bot.get_cog("Embeds").Embed(desc='\n'.join(d),color=1655066).update_timestamp().set_author(self.bot.user)
+        await self.bot.get_cog("Embeds").send([emb],url="loop")
+        self.bot.log.debug(d[0])
+        if len(report['errors']) > 0:
+            self.bot.log.warn("[Rss loop] "+d[1])
+
+    @tasks.loop(seconds=30)
     async def loop_child(self):
-        if not self.bot.database_online:
-            self.bot.log.warn('Base de donnée hors ligne - check rss annulé')
+        if not self.bot.database_online or not self.bot.rss_enabled:
             return
-        self.bot.log.info(" Boucle rss commencée !")
-        t1 = time.time()
-        await self.bot.get_cog("Rss").main_loop()
-        self.bot.log.info(" Boucle rss terminée en {}s!".format(round(time.time()-t1,2)))
+        try:
+            await self.check_due_flows()
+            # entries delivered since the last check
+            await self.flush_flow_dates()
+            if self.loop_report['start'] < time.time() - self.time_loop*60:
+                self.save_loop_state()
+                await self.send_loop_report()
+        except Exception as e:
+            await self.bot.get_cog('Errors').on_error(e,None)
     
     @loop_child.before_loop
     async def before_printer(self):
@@ -84,53 +84,48 @@ class Servers(commands.Cog):
                'ttt_display': 2}
         self.optionsList = ["prefix","language","description","clear","slowmode","mute","kick","ban","warn","say","welcome_channel","welcome","leave","welcome_roles","bot_news","update_mentions","poll_channels","partner_channel","partner_color","partner_role","modlogs_channel","verification_role","enable_xp","levelup_msg","levelup_channel","noxp_channels","xp_rate","xp_type","anti_caps_lock","enable_fun","membercounter","anti_raid","vote_emojis","morpion_emojis","help_in_dm","compress_help","muted_role","voice_roles","voice_channel","voice_category","voice_channel_format","ttt_display"]
         self.membercounter_pending = {}
+        self.cache: typing.Dict[int, list] = dict() # guild ID -> [fetch timestamp, raw config row or None]
+        self.cache_ttl = 600 # seconds before a cached config is fetched again
 
     @commands.Cog.listener()
     async def on_ready(self):
         self.table = 'servers_beta' if self.bot.beta else 'servers'
+        await self.load_cache()
 
 
     async def get_bot_infos(self, botID: int):
         """Return every options of the bot"""
         if not self.bot.database_online:
             return list()
-        cnx = self.bot.cnx_frm
-        cursor = cnx.cursor(dictionary=True)
         query = ("SELECT * FROM `bot_infos` WHERE `ID`={}".format(botID))
-        cursor.execute(query)
-        liste = list()
-        for x in cursor:
-            liste.append(x)
+        async with self.bot.db.acquire() as cnx:
+            liste = await cnx.fetch(query)
         return liste
     
     async def edit_bot_infos(self, botID: int, values=[()]):
         if type(values)!=list:
             raise ValueError
         v = list()
-        cnx = self.bot.cnx_frm
-        cursor = cnx.cursor()
         for x in values:
             if type(x) == bool:
                 v.append("`{x[0]}`={x[1]}".format(x=x))
             else:
                 v.append("""`{x[0]}`="{x[1]}" """.format(x=x))
         query = ("UPDATE `bot_infos` SET {v} WHERE `ID`='{id}'".format(v=",".join(v),id=botID))
-        cursor.execute(query)
-        cnx.commit()
-        cursor.close()
+        async with self.bot.db.acquire() as cnx:
+            await cnx.execute(query)
         return True
 
     async def get_languages(self, ignored_guilds: typing.List[int], return_dict: bool = False):
         """Return stats on used languages"""
         if not self.bot.database_online:
             return list()
-        cnx = self.bot.cnx_frm
-        cursor = cnx.cursor(dictionary=True)
         query = ("SELECT `language`,`ID` FROM `{}`".format(self.table))
-        cursor.execute(query)
+        async with self.bot.db.acquire() as cnx:
+            rows = await cnx.fetch(query)
         liste = list()
         guilds = [x.id for x in self.bot.guilds if x.id not in ignored_guilds]
-        for x in cursor:
+        for x in rows:
             if x['ID'] in guilds:
                 liste.append(x['language'])
         for _ in range(len(guilds)-len(liste)):
@@ -149,13 +144,12 @@ class Servers(commands.Cog):
         """Return stats on used xp types"""
         if not self.bot.database_online:
             return list()
-        cnx = self.bot.cnx_frm
-        cursor = cnx.cursor(dictionary=True)
         query = ("SELECT `xp_type`,`ID` FROM `{}`".format(self.table))
-        cursor.execute(query)
+        async with self.bot.db.acquire() as cnx:
+            rows = await cnx.fetch(query)
         liste = list()
         guilds = [x.id for x in self.bot.guilds if x.id not in ignored_guilds]
-        for x in cursor:
+        for x in rows:
             if x['ID'] in guilds:
                 liste.append(x['xp_type'])
         for _ in range(len(guilds)-len(liste)):
@@ -194,37 +188,63 @@ class Servers(commands.Cog):
             ID = ID.id
         elif ID is None or not self.bot.database_online:
             return None
-        l = await self.get_server([name],criters=["ID="+str(ID)],Type=list)
-        if l == []:
+        row = await self.get_cached_config(ID)
+        if row is None:
             return None
-        elif l[0][0] == '':
+        elif row[name] == '':
             return self.default_opt[name]
         else:
-            return l[0][0]
-        
+            return row[name]
+
+    async def load_cache(self):
+        """Load the config of every guild into the cache, with one single query"""
+        if not self.bot.database_online:
+            return
+        async with self.bot.db.acquire() as cnx:
+            rows = await cnx.fetch("SELECT * FROM `{}`".format(self.table))
+        now = time.time()
+        self.cache = {row['ID']: [now, row] for row in rows}
+        self.bot.log.info("Servers config cache loaded (%d guilds)", len(self.cache))
+
+    async def get_cached_config(self, ID: int) -> typing.Optional[dict]:
+        """Get the raw config row of a guild, from the cache if it's still fresh
+        Return None if the guild is not in the database"""
+        ID = int(ID)
+        cached = self.cache.get(ID)
+        if cached is not None and cached[0] + self.cache_ttl > time.time():
+            return cached[1]
+        return await self.refresh_cache(ID)
+
+    async def refresh_cache(self, ID: int) -> typing.Optional[dict]:
+        """Fetch the config row of a guild from the database and store it into the cache"""
+        await self.bot.wait_until_ready()
+        ID = int(ID)
+        async with self.bot.db.acquire() as cnx:
+            row = await cnx.fetchone("SELECT * FROM `{}` WHERE `ID`=%s".format(self.table), (ID,))
+        self.cache[ID] = [time.time(), row]
+        return row
+
     async def get_server(self, columns=[], criters=["ID > 1"], relation="AND", Type=dict):
         """return every options of a server"""
         await self.bot.wait_until_ready()
         if type(columns)!=list or type(criters)!=list:
             raise ValueError
-        cnx = self.bot.cnx_frm
-        cursor = cnx.cursor(dictionary = (Type==dict))
         if columns == []:
             cl = "*"
         else:
             cl = "`"+"`,`".join(columns)+"`"
         relation = " "+relation+" "
         query = ("SELECT {} FROM `{}` WHERE {}".format(cl,self.table,relation.join(criters)))
-        cursor.execute(query)
+        async with self.bot.db.acquire() as cnx:
+            rows = await cnx.fetch(query, dictionary=(Type==dict))
         liste = list()
-        for x in cursor:
+        for x in rows:
             if isinstance(x, dict):
                 for k, v in x.items():
                     if v == '':
                         x[k] = self.default_opt[k]
             liste.append(x)
-        cursor.close()
-        return liste    
+        return liste
 
     async def modify_server(self, ID: int, values=[()]):
         """Update a server config in the database"""
@@ -232,15 +252,13 @@ class Servers(commands.Cog):
             raise ValueError
         v = list()
         v2 = dict()
-        cnx = self.bot.cnx_frm
-        cursor = cnx.cursor()
         for e, x in enumerate(values):
             v.append(f"`{x[0]}` = %(v{e})s")
             v2[f'v{e}'] = x[1]
         query = ("UPDATE `{t}` SET {v} WHERE `ID`='{id}'".format(t=self.table, v=",".join(v), id=ID))
-        cursor.execute(query, v2)
-        cnx.commit()
-        cursor.close()
+        async with self.bot.db.acquire() as cnx:
+            await cnx.execute(query, v2)
+        await self.refresh_cache(ID)
         return True
 
     async def delete_option(self, ID: int, opt):
@@ -259,11 +277,10 @@ class Servers(commands.Cog):
         if type(ID) == str:
             if not ID.isnumeric():
                 raise ValueError
-        cnx = self.bot.cnx_frm
-        cursor = cnx.cursor()
         query = ("INSERT INTO `{}` (`ID`) VALUES ('{}')".format(self.table,ID))
-        cursor.execute(query)
-        cnx.commit()
+        async with self.bot.db.acquire() as cnx:
+            await cnx.execute(query)
+        await self.refresh_cache(ID)
         return True
 
     async def is_server_exist(self, ID: int):
@@ -282,12 +299,10 @@ class Servers(commands.Cog):
         """remove a server from the db"""
         if not isinstance(ID, int):
             raise ValueError
-        cnx = self.bot.cnx_frm
-        cursor = cnx.cursor()
         query = ("DELETE FROM `{}` WHERE `ID`='{}'".format(self.table,ID))
-        cursor.execute(query)
-        cnx.commit()
-        cursor.close()
+        async with self.bot.db.acquire() as cnx:
+            await cnx.execute(query)
+        self.cache[ID] = [time.time(), None]
         return True
                  
 
@@ -5,23 +5,20 @@ import asyncio
 import io
 import importlib
 import re
-import os
-import operator
 import typing
-import aiohttp
 import mysql
 import string
-from discord.ext import commands
+from bisect import bisect_right
+from discord.ext import commands, tasks
 from math import ceil
-import numpy as np
-from PIL import Image, ImageDraw, ImageFont, ImageSequence, ImageEnhance
-from urllib.request import urlopen, Request
-from io import BytesIO
-from math import sqrt
+from PIL import Image
 
 from fcts import args, checks
 importlib.reload(args)
 importlib.reload(checks)
+from libs.card_cache import CardCache
+from libs.rank_cards import CardRenderer, RendererOverloaded
+from libs.rank_index import RankIndex
 from utils import zbot, MyContext
 
 
@@ -31,7 +28,11 @@ class Xp(commands.Cog):
     def __init__(self, bot: zbot):
         self.bot = bot
         self.cache = {'global':{}}
+        self.ranks: typing.Dict[typing.Union[str, int], RankIndex] = {'global': RankIndex()} # same keys as self.cache
         self.levels = [0]
+        self.levels_starts: typing.List[int] = [0, 1] # minimal xp for each level (global & local systems)
+        self.mee6_levels: typing.List[int] = [0] # minimal xp for each level (MEE6-like system)
+        self.extend_levels_tables(1000)
         self.embed_color = discord.Colour(0xffcf50)
         self.table = 'xp_beta' if bot.beta else 'xp'
         self.cooldown = 30
@@ -42,19 +43,36 @@ class Xp(commands.Cog):
         self.file = 'xp'
         self.xp_channels_cache = dict()
         self.sus = None
+        self.pending_xp: typing.Dict[typing.Optional[int], typing.Dict[int, float]] = dict() # guild ID (None for global xp) -> {user ID: xp to add}
+        self.inflight_xp: typing.Dict[typing.Optional[int], typing.Dict[int, float]] = dict() # same as pending_xp, for the xp being written
+        self.xp_flush_delay = 30 # seconds between two writes of the pending xp
+        self.xp_flush_threshold = 500 # number of pending users which triggers an early write
+        self.xp_flush_chunk = 1000 # max rows per INSERT query
+        self.flush_lock = asyncio.Lock()
         bot.add_listener(self.add_xp,'on_message')
         self.types = ['global','mee6-like','local']
-        try:
-            verdana_name = 'Verdana.ttf'
-            xp_font = ImageFont.truetype(verdana_name, 24)
-        except OSError:
-            verdana_name = 'Veranda.ttf'
-            xp_font = ImageFont.truetype(verdana_name, 24)
-        self.fonts = {'xp_fnt': xp_font,
-        'NIVEAU_fnt': ImageFont.truetype(verdana_name, 42),
-        'levels_fnt': ImageFont.truetype(verdana_name, 65),
-        'rank_fnt': ImageFont.truetype(verdana_name,29),
-        'RANK_fnt': ImageFont.truetype(verdana_name,23)}
+        self.card_renderer = CardRenderer(workers=2, max_queue=10)
+        self.max_card_frames = 60 # animated avatars are reduced to this number of frames
+        self.cards_cache = CardCache(max_memory=32*1024**2, disk_dir='../cards/cache', max_disk=256*1024**2, log=bot.log)
+        # pylint: disable=no-member
+        self.xp_flush_loop.change_interval(seconds=self.xp_flush_delay)
+        self.xp_flush_loop.start()
+
+    def cog_unload(self):
+        # pylint: disable=no-member
+        self.xp_flush_loop.cancel()
+        self.card_renderer.close()
+        # don't lose what hasn't been written yet
+        self.bot.loop.create_task(self.bdd_flush_xp())
+
+    @tasks.loop(seconds=30)
+    async def xp_flush_loop(self):
+        await self.bdd_flush_xp()
+
+    @xp_flush_loop.before_loop
+    async def before_xp_flush(self):
+        """Wait until the bot is ready"""
+        await self.bot.wait_until_ready()
     
     @commands.Cog.listener()
     async def on_ready(self):
@@ -123,7 +141,7 @@ class Xp(commands.Cog):
         # check for sus people
         if msg.author.id in self.sus:
             await self.send_sus_msg(msg, giv_points)
-        self.cache['global'][msg.author.id] = [round(time.time()), prev_points+giv_points]
+        self.update_cache('global', msg.author.id, prev_points+giv_points)
         new_lvl = await self.calc_level(self.cache['global'][msg.author.id][1],0)
         if 0 < (await self.calc_level(prev_points,0))[0] < new_lvl[0]:
             await self.send_levelup(msg, new_lvl)
@@ -155,7 +173,7 @@ class Xp(commands.Cog):
         # check for sus people
         if msg.author.id in self.sus:
             await self.send_sus_msg(msg, giv_points)
-        self.cache[msg.guild.id][msg.author.id] = [round(time.time()), prev_points+giv_points]
+        self.update_cache(msg.guild.id, msg.author.id, prev_points+giv_points)
         new_lvl = await self.calc_level(self.cache[msg.guild.id][msg.author.id][1],1)
         if 0 < (await self.calc_level(prev_points,1))[0] < new_lvl[0]:
             await self.send_levelup(msg,new_lvl)
@@ -187,7 +205,7 @@ class Xp(commands.Cog):
         # check for sus people
         if msg.author.id in self.sus:
             await self.send_sus_msg(msg, giv_points)
-        self.cache[msg.guild.id][msg.author.id] = [round(time.time()), prev_points+giv_points]
+        self.update_cache(msg.guild.id, msg.author.id, prev_points+giv_points)
         new_lvl = await self.calc_level(self.cache[msg.guild.id][msg.author.id][1],2)
         if 0 < (await self.calc_level(prev_points,2))[0] < new_lvl[0]:
             await self.send_levelup(msg,new_lvl)
@@ -267,32 +285,37 @@ class Xp(commands.Cog):
             content = content.replace(match.group(0),"")
         return min(round(len(content)*self.xp_per_char), self.max_xp_per_msg)
 
+    def extend_levels_tables(self, max_level: int):
+        """Precompute the xp thresholds of every level up to max_level"""
+        for lvl in range(len(self.levels_starts), max_level+2):
+            # inverse of ceil(0.056*xp**0.65), then fixed against float rounding
+            x = int(((lvl-1)*125/7)**(20/13)) + 1
+            while x > 1 and ceil(0.056*(x-1)**0.65) >= lvl:
+                x -= 1
+            while ceil(0.056*x**0.65) < lvl:
+                x += 1
+            self.levels_starts.append(x)
+        for lvl in range(len(self.mee6_levels), max_level+2):
+            # sum of 5*i**2 + 50*i + 100 for i in [0, lvl[
+            self.mee6_levels.append(5*(lvl-1)*lvl*(2*lvl-1)//6 + 25*lvl*(lvl-1) + 100*lvl)
+
     async def calc_level(self, xp: int, system: int):
         """Calcule le niveau correspondant à un nombre d'xp"""
         if system != 1:
             if xp == 0:
                 return [0,ceil((1*125/7)**(20/13)),0]
             lvl = ceil(0.056*xp**0.65)
-            next_step = xp
-            while ceil(0.056*next_step**0.65)==lvl:
-                next_step += 1
-            return [lvl,next_step,ceil(((lvl-1)*125/7)**(20/13))]
+            if lvl+1 >= len(self.levels_starts):
+                self.extend_levels_tables(lvl*2)
+            return [lvl,self.levels_starts[lvl+1],ceil(((lvl-1)*125/7)**(20/13))]
         # Niveau actuel - XP total pour le prochain niveau - XP total pour le niveau actuel
         else:
-            def recursive(lvl):
-                t = 0
-                for i in range(lvl):
-                    t += 5*pow(i,2) + 50*i + 100
-                return t
-
             if xp == 0:
                 return [0,100,0]
-            lvl = 0
-            total_xp = 0
-            while xp >= total_xp:
-                total_xp += 5*pow(lvl,2) + 50*lvl + 100
-                lvl += 1
-            return [lvl-1,recursive(lvl),recursive(lvl-1)]
+            while self.mee6_levels[-1] <= xp:
+                self.extend_levels_tables(len(self.mee6_levels)*2)
+            lvl = bisect_right(self.mee6_levels, xp)
+            return [lvl-1,self.mee6_levels[lvl],self.mee6_levels[lvl-1]]
 
     async def give_rr(self, member: discord.Member, level: int, rr_list: list, remove: bool=False):
         """Give (and remove?) roles rewards to a member"""
@@ -353,19 +376,18 @@ class Xp(commands.Cog):
         """Get the table name of a guild, and create one if no one exist"""
         if guild is None:
             return self.table
-        cnx = self.bot.cnx_xp
-        cursor = cnx.cursor()
-        try:
-            cursor.execute("SELECT 1 FROM `{}` LIMIT 1;".format(guild))
-            return guild
-        except mysql.connector.errors.ProgrammingError:
-            if createIfNeeded:
-                cursor.execute("CREATE TABLE `{}` LIKE `example`;".format(guild))
-                self.bot.log.info(f"[get_table] XP Table `{guild}` created")
-                cursor.execute("SELECT 1 FROM `{}` LIMIT 1;".format(guild))
+        async with self.bot.db.acquire('xp') as cnx:
+            try:
+                await cnx.fetch("SELECT 1 FROM `{}` LIMIT 1;".format(guild))
                 return guild
-            else:
-                return None
+            except mysql.connector.errors.ProgrammingError:
+                if createIfNeeded:
+                    await cnx.execute("CREATE TABLE `{}` LIKE `example`;".format(guild))
+                    self.bot.log.info(f"[get_table] XP Table `{guild}` created")
+                    await cnx.fetch("SELECT 1 FROM `{}` LIMIT 1;".format(guild))
+                    return guild
+                else:
+                    return None
 
 
     async def bdd_set_xp(self, userID: int, points: int, Type: str='add', guild: int=None):
@@ -376,51 +398,155 @@ class Xp(commands.Cog):
                 return None
             if points < 0:
                 return True
-            if guild is None:
-                cnx = self.bot.cnx_frm
-            else:
-                cnx = self.bot.cnx_xp
-            table = await self.get_table(guild)
-            cursor = cnx.cursor(dictionary = True)
             if Type=='add':
-                query = ("INSERT INTO `{t}` (`userID`,`xp`) VALUES ('{u}','{p}') ON DUPLICATE KEY UPDATE xp = xp + '{p}';".format(t=table,p=points,u=userID))
-            else:
+                self.queue_xp(userID, points, guild)
+                if sum(len(x) for x in self.pending_xp.values()) >= self.xp_flush_threshold and not self.flush_lock.locked():
+                    self.bot.loop.create_task(self.bdd_flush_xp())
+                return True
+            # a forced value overrides every pending increment, so it must be written after the ones being written
+            async with self.flush_lock:
+                if guild in self.pending_xp:
+                    self.pending_xp[guild].pop(userID, None)
+                table = await self.get_table(guild)
                 query = ("INSERT INTO `{t}` (`userID`,`xp`) VALUES ('{u}','{p}') ON DUPLICATE KEY UPDATE xp = '{p}';".format(t=table,p=points,u=userID))
-            cursor.execute(query)
-            cnx.commit()
-            cursor.close()
+                async with self.bot.db.acquire('frm' if guild is None else 'xp') as cnx:
+                    await cnx.execute(query)
             return True
         except Exception as e:
             await self.bot.get_cog('Errors').on_error(e,None)
             return False
+
+    def queue_xp(self, userID: int, points: float, guild: int=None):
+        """Add some xp to a user, waiting to be written into the database"""
+        users = self.pending_xp.setdefault(guild, dict())
+        users[userID] = users.get(userID, 0) + points
+
+    def unsaved_xp(self, userID: int, guild: int=None) -> float:
+        """Get the xp of a user which is not in the database yet (waiting or being written)"""
+        return self.pending_xp.get(guild, {}).get(userID, 0) + self.inflight_xp.get(guild, {}).get(userID, 0)
+
+    async def bdd_flush_xp(self):
+        """Write every pending xp increment into the database
+        Each database gets a single transaction, with one multi-rows query per table"""
+        async with self.flush_lock:
+            if len(self.pending_xp) == 0 or not self.bot.database_online:
+                return
+            # the increments stay visible to the readers until they are written
+            pending, self.pending_xp = self.pending_xp, dict()
+            self.inflight_xp = pending
+            t = time.time()
+            rows = 0
+            try:
+                for db_name in ('frm', 'xp'):
+                    batch = {g: users for g, users in pending.items() if (g is None) == (db_name == 'frm') and len(users) > 0}
+                    if len(batch) == 0:
+                        continue
+                    try:
+                        tables = {g: await self.get_table(g) for g in batch.keys()}
+                        async with self.bot.db.acquire(db_name) as cnx:
+                            await cnx.begin()
+                            try:
+                                for g, users in batch.items():
+                                    items = list(users.items())
+                                    for i in range(0, len(items), self.xp_flush_chunk):
+                                        chunk = items[i:i+self.xp_flush_chunk]
+                                        query = "INSERT INTO `{}` (`userID`,`xp`) VALUES {} ON DUPLICATE KEY UPDATE `xp` = `xp` + VALUES(`xp`);".format(tables[g], ','.join(['(%s,%s)']*len(chunk)))
+                                        await cnx.execute(query, [v for item in chunk for v in item])
+                                await cnx.commit()
+                            except Exception:
+                                await cnx.rollback()
+                                raise
+                            # now read from the database
+                            for g in batch.keys():
+                                self.inflight_xp.pop(g, None)
+                        rows += sum(len(users) for users in batch.values())
+                    except Exception as e:
+                        await self.bot.get_cog('Errors').on_error(e,None)
+            finally:
+                # give the unwritten increments back, so they can be written next time
+                for g, users in self.inflight_xp.items():
+                    for userID, points in users.items():
+                        self.queue_xp(userID, points, g)
+                self.inflight_xp = dict()
+            if statsCog := self.bot.get_cog("BotStats"):
+                statsCog.xp_flushes['count'] += 1
+                statsCog.xp_flushes['rows'] += rows
+                statsCog.xp_flushes['time'] += time.time() - t
+            self.bot.log.debug("[xp] %d users xp written in %.3fs", rows, time.time()-t)
     
+    def update_cache(self, key: typing.Union[str, int], userID: int, xp: float, timestamp: int=None):
+        """Update the xp of a user in the cache and in the ranks index"""
+        if timestamp is None:
+            timestamp = round(time.time())
+        self.cache.setdefault(key, dict())[userID] = [timestamp, xp]
+        self.ranks.setdefault(key, RankIndex()).set(userID, xp)
+
+    async def get_ranks_index(self, key: typing.Union[str, int]) -> RankIndex:
+        """Get the ranks index of a guild (or 'global'), loading it if needed"""
+        if key == 'global':
+            if len(self.cache['global']) == 0:
+                await self.bdd_load_cache(-1)
+        elif key not in self.cache.keys():
+            await self.bdd_load_cache(key)
+        return self.ranks.setdefault(key, RankIndex())
+
+    def get_members_ranks(self, index: RankIndex, guild: discord.Guild, start: int=0, count: int=None) -> typing.List[typing.Tuple[int, float]]:
+        """Get the (userID, xp) couples of a guild members from a global ranks index, by decreasing xp
+        Stops walking the ranking as soon as the requested page is full"""
+        members = {m.id for m in guild.members}
+        if len(members) * 16 < len(index):
+            # small guild: sorting its members is cheaper than walking the whole ranking
+            ranked = sorted(((userID, xp) for userID in members if (xp := index.get(userID)) is not None), key=lambda x: (-x[1], x[0]))
+            return ranked[start:] if count is None else ranked[start:start+count]
+        result = list()
+        skipped = 0
+        for userID, xp in index.iter_from(0):
+            if userID not in members:
+                continue
+            if skipped < start:
+                skipped += 1
+                continue
+            result.append((userID, xp))
+            if count is not None and len(result) >= count:
+                break
+        return result
+
+    def get_members_rank(self, index: RankIndex, guild: discord.Guild, userID: int) -> typing.Optional[int]:
+        """Get the rank of a user among the members of a guild, from a global ranks index"""
+        xp = index.get(userID)
+        if xp is None:
+            return None
+        key = (-xp, userID)
+        return 1 + sum(1 for m in guild.members if (m_xp := index.get(m.id)) is not None and (-m_xp, m.id) < key)
+
+    def count_members_ranked(self, index: RankIndex, guild: discord.Guild) -> int:
+        """Get the number of guild members present in a global ranks index"""
+        return sum(1 for m in guild.members if m.id in index)
+
     async def bdd_get_xp(self, userID: int, guild: int):
         try:
             if not self.bot.database_online:
                 self.bot.unload_extension("fcts.xp")
                 return None
-            if guild is None:
-                cnx = self.bot.cnx_frm
-            else:
-                cnx = self.bot.cnx_xp
             table = await self.get_table(guild, False)
             if table is None:
                 return None
             query = ("SELECT `xp` FROM `{}` WHERE `userID`={} AND `banned`=0".format(table,userID))
-            cursor = cnx.cursor(dictionary = True)
-            cursor.execute(query)
-            liste = list()
-            for x in cursor:
-                liste.append(x)
+            async with self.bot.db.acquire('frm' if guild is None else 'xp') as cnx:
+                liste = await cnx.fetch(query)
+            # include xp which hasn't been written yet
+            if pending := self.unsaved_xp(userID, guild):
+                if len(liste) == 0:
+                    liste.append({'xp': 0})
+                liste[0]['xp'] += pending
             if len(liste)==1:
                 g = 'global' if guild is None else guild
                 if isinstance(g, int) and g not in self.cache:
                     await self.bdd_load_cache(g)
                 if userID in self.cache[g].keys():
-                    self.cache[g][userID][1] = liste[0]['xp']
+                    self.update_cache(g, userID, liste[0]['xp'], self.cache[g][userID][0])
                 else:
-                    self.cache[g][userID] = [round(time.time())-60,liste[0]['xp']]
-            cursor.close()
+                    self.update_cache(g, userID, liste[0]['xp'], round(time.time())-60)
             return liste
         except Exception as e:
             await self.bot.get_cog('Errors').on_error(e,None)
@@ -431,23 +557,8 @@ class Xp(commands.Cog):
             if not self.bot.database_online:
                 self.bot.unload_extension("fcts.xp")
                 return None
-            if guild is None:
-                cnx = self.bot.cnx_frm
-            else:
-                cnx = self.bot.cnx_xp
-            table = await self.get_table(guild, False)
-            if table is None:
-                return 0
-            query = ("SELECT COUNT(*) FROM `{}` WHERE `banned`=0".format(table))
-            cursor = cnx.cursor(dictionary = False)
-            cursor.execute(query)
-            liste = list()
-            for x in cursor:
-                liste.append(x)
-            cursor.close()
-            if liste is not None and len(liste)==1:
-                return liste[0][0]
-            return 0
+            index = await self.get_ranks_index('global' if guild is None else guild)
+            return len(index)
         except Exception as e:
             await self.bot.get_cog('Errors').on_error(e,None)
 
@@ -459,32 +570,23 @@ class Xp(commands.Cog):
             target_global = (guild == -1)
             if target_global:
                 self.bot.log.info("Chargement du cache XP (global)")
-                cnx = self.bot.cnx_frm
                 query = ("SELECT `userID`,`xp` FROM `{}` WHERE `banned`=0".format(self.table))
             else:
                 self.bot.log.info("Chargement du cache XP (guild {})".format(guild))
                 table = await self.get_table(guild,False)
                 if table is None:
                     self.cache[guild] = dict()
+                    self.ranks[guild] = RankIndex()
                     return 
-                cnx = self.bot.cnx_xp
                 query = ("SELECT `userID`,`xp` FROM `{}` WHERE `banned`=0".format(table))
-            cursor = cnx.cursor(dictionary = True)
-            cursor.execute(query)
-            liste = list()
-            for x in cursor:
-                liste.append(x)
-            if target_global:
-                if len(self.cache['global'].keys()) == 0:
-                    self.cache['global'] = dict()
-                for l in liste:
-                    self.cache['global'][l['userID']] = [round(time.time())-60, int(l['xp'])]
-            else:
-                if guild not in self.cache.keys():
-                    self.cache[guild] = dict()
-                for l in liste:
-                    self.cache[guild][l['userID']] = [round(time.time())-60, int(l['xp'])]
-            cursor.close()
+            async with self.bot.db.acquire('frm' if target_global else 'xp') as cnx:
+                liste = await cnx.fetch(query)
+            key = 'global' if target_global else guild
+            if key not in self.cache.keys():
+                self.cache[key] = dict()
+            for l in liste:
+                self.cache[key][l['userID']] = [round(time.time())-60, int(l['xp']) + self.unsaved_xp(l['userID'], None if target_global else guild)]
+            self.ranks[key] = RankIndex((userID, value[1]) for userID, value in self.cache[key].items())
             return
         except Exception as e:
             await self.bot.get_cog('Errors').on_error(e,None)
@@ -494,35 +596,38 @@ class Xp(commands.Cog):
             if not self.bot.database_online:
                 self.bot.unload_extension("fcts.xp")
                 return None
-            if guild is not None and await self.bot.get_config(guild.id,'xp_type') != 0:
-                cnx = self.bot.cnx_xp
+            if guild is not None and await self.bot.get_config(guild.id,'xp_type') == 0:
+                # global xp filtered by guild members
+                index = await self.get_ranks_index('global')
+                return [{'userID': userID, 'xp': xp} for userID, xp in self.get_members_ranks(index, guild, 0, top)]
+            if guild is not None:
+                db_name = 'xp'
                 query = ("SELECT * FROM `{}` order by `xp` desc".format(await self.get_table(guild.id,False)))
             else:
-                cnx = self.bot.cnx_frm
+                db_name = 'frm'
                 query = ("SELECT * FROM `{}` order by `xp` desc".format(self.table))
-            cursor = cnx.cursor(dictionary = True)
             try:
-                cursor.execute(query)
+                async with self.bot.db.acquire(db_name) as cnx:
+                    rows = await cnx.fetch(query)
             except mysql.connector.errors.ProgrammingError as e:
                 if e.errno == 1146:
                     return list()
                 raise e
             liste = list()
             if guild is None:
-                liste = list(cursor)
+                liste = rows
                 if top is not None:
                     liste = liste[:top]
             else:
-                ids = [x.id for x in guild.members]
+                ids = {x.id for x in guild.members}
                 i = 0
-                l2 = list(cursor)
+                l2 = rows
                 if top is None:
                     top = len(l2)
                 while len(liste)<top and i<len(l2):
                     if l2[i]['userID'] in ids:
                         liste.append(l2[i])
                     i += 1
-            cursor.close()
             return liste
         except Exception as e:
             await self.bot.get_cog('Errors').on_error(e,None)
@@ -534,32 +639,17 @@ class Xp(commands.Cog):
                 self.bot.unload_extension("fcts.xp")
                 return None
             if guild is not None and await self.bot.get_config(guild.id,'xp_type') != 0:
-                cnx = self.bot.cnx_xp
-                query = ("SELECT `userID`,`xp`, @curRank := @curRank + 1 AS rank FROM `{}` p, (SELECT @curRank := 0) r WHERE `banned`='0' ORDER BY xp desc;".format(await self.get_table(guild.id, False)))
+                index = await self.get_ranks_index(guild.id)
+                rank = index.rank(userID)
+            elif guild is not None:
+                index = await self.get_ranks_index('global')
+                rank = self.get_members_rank(index, guild, userID)
             else:
-                cnx = self.bot.cnx_frm
-                query = ("SELECT `userID`,`xp`, @curRank := @curRank + 1 AS rank FROM `{}` p, (SELECT @curRank := 0) r WHERE `banned`='0' ORDER BY xp desc;".format(self.table))
-            cursor = cnx.cursor(dictionary = True)
-            try:
-                cursor.execute(query)
-            except mysql.connector.errors.ProgrammingError as e:
-                if e.errno == 1146:
-                    return {"rank":0, "xp":0}
-                raise e
-            userdata = dict()
-            i = 0
-            users = list()
-            if guild is not None:
-                users = [x.id for x in guild.members]
-            for x in cursor:
-                if (guild is not None and x['userID'] in users) or guild is None:
-                    i += 1
-                if x['userID']== userID:
-                    # x['rank'] = i
-                    userdata = x
-                    userdata["rank"] = round(userdata["rank"])
-                    break
-            cursor.close()
+                index = await self.get_ranks_index('global')
+                rank = index.rank(userID)
+            if rank is None:
+                return dict()
+            userdata = {'userID': userID, 'xp': index.get(userID), 'rank': rank}
             return userdata
         except Exception as e:
             await self.bot.get_cog('Errors').on_error(e,None)
@@ -570,14 +660,9 @@ class Xp(commands.Cog):
             if not self.bot.database_online:
                 self.bot.unload_extension("fcts.xp")
                 return None
-            cnx = self.bot.cnx_frm
-            cursor = cnx.cursor(dictionary = True)
             query = ("SELECT SUM(xp) FROM `{}`".format(self.table))
-            cursor.execute(query)
-            liste = list()
-            for x in cursor:
-                liste.append(x)
-            cursor.close()
+            async with self.bot.db.acquire() as cnx:
+                liste = await cnx.fetch(query)
             result = round(liste[0]['SUM(xp)'])
 
             # cnx = self.bot.cnx_xp
@@ -595,64 +680,30 @@ class Xp(commands.Cog):
             await self.bot.get_cog('Errors').on_error(e,None)
 
 
-    async def get_raw_image(self, url:str):
-        req = Request(url, headers={'User-Agent': 'Mozilla/5.0'})
-        im = Image.open(io.BytesIO(urlopen(req).read()))
-        return im
-
-    def calc_pos(self, text:str, font, x: int, y: int, align: str='center'):
-        w,h = font.getsize(text)
-        if align == 'center':
-            return x-w/2,y-h/2
-        elif align == 'right':
-            return x-w,y-h/2
-
     async def create_card(self, user, style, xp, used_system:int, rank=[1,0], txt=['NIVEAU','RANG'], force_static=False, levels_info=None):
-        """Crée la carte d'xp pour un utilisateur"""
-        card = Image.open("../cards/model/{}.png".format(style))
+        """Crée la carte d'xp pour un utilisateur
+        Raise RendererOverloaded if too many cards are already waiting to be rendered"""
         bar_colors = await self.get_xp_bar_color(user.id)
         if levels_info is None:
             levels_info = await self.calc_level(xp,used_system)
         colors = {'name':(124, 197, 118),'xp':(124, 197, 118),'NIVEAU':(255, 224, 77),'rank':(105, 157, 206),'bar':bar_colors}
         if style=='blurple':
             colors = {'name':(35,35,50),'xp':(235, 235, 255),'NIVEAU':(245, 245, 255),'rank':(255, 255, 255),'bar':(70, 83, 138)}
-        
-        name_fnt = ImageFont.truetype('Roboto-Medium.ttf', 40)
-
-        if not user.is_avatar_animated() or force_static:
-            pfp = await self.get_raw_image(user.avatar_url_as(format='png',size=256))
-            img = await self.bot.loop.run_in_executor(None,self.add_overlay,pfp.resize(size=(282,282)),user,card,xp,rank,txt,colors,levels_info,name_fnt)
-            img.save('../cards/global/{}-{}-{}.png'.format(user.id,xp,rank[0]))
-            card.close()
-            return discord.File('../cards/global/{}-{}-{}.png'.format(user.id,xp,rank[0]))
-
-        else:
-            async with aiohttp.ClientSession() as cs:
-                async with cs.get(str(user.avatar_url_as(format='gif',size=256))) as r:
-                    response = await r.read()
-                    pfp = Image.open(BytesIO(response))
 
-            images = []
-            duration = []
-            frames = [frame.copy() for frame in ImageSequence.Iterator(pfp)]
-            for frame in frames:
-                frame = frame.convert(mode='RGBA')
-                img = await self.bot.loop.run_in_executor(None,self.add_overlay,frame.resize(size=(282,282)),user,card.copy(),xp,rank,txt,colors,levels_info,name_fnt)
-                img = ImageEnhance.Contrast(img).enhance(1.5).resize((800,265))
-                images.append(img)
-                duration.append(pfp.info['duration'])
-                
-            card.close()
-
-            # image_file_object = BytesIO()
-            gif = images[0]
-            filename = '../cards/global/{}-{}-{}.gif'.format(user.id,xp,rank[0])
-            gif.save(filename, format='gif', save_all=True, append_images=images[1:], loop=0, duration=duration, subrectangles=True)
-            # image_file_object.seek(0)
-            # return discord.File(fp=image_file_object, filename='card.gif')
-            return discord.File('../cards/global/{}-{}-{}.gif'.format(user.id,xp,rank[0]))
-            # imageio.mimwrite('../cards/global/{}-{}-{}.gif'.format(user.id,xp,rank[0]), images, format="GIF-PIL", duration=duration, subrectangles=True)
-            # return discord.File('../cards/global/{}-{}-{}.gif'.format(user.id,xp,rank[0]))
+        animated = user.is_avatar_animated() and not force_static
+        ext = 'gif' if animated else 'png'
+        avatar_hash = user.avatar or f"default-{user.default_avatar.value}"
+        key = self.cards_cache.make_key(avatar_hash, animated, style, user.name, xp, tuple(levels_info), tuple(rank), tuple(txt), colors)
+        result = self.cards_cache.get(key, ext)
+        if result is None:
+            avatar = await self.bot.fetch_asset(user.avatar_url_as(format='gif' if animated else 'png', size=256))
+            job = {'avatar': avatar, 'animated': animated, 'style': style, 'username': user.name, 'xp': xp,
+                'rank': rank, 'texts': txt, 'colors': colors, 'levels_info': levels_info, 'max_frames': self.max_card_frames}
+            result = await self.card_renderer.render(job)
+            self.cards_cache.set(key, ext, result)
+            if statsCog := self.bot.get_cog("BotStats"):
+                statsCog.xp_cards += 1
+        return discord.File(io.BytesIO(result), filename=f'card.{ext}')
 
     def compress(self, original_file, max_size, scale: float):
         assert(0.0 < scale < 1.0)
@@ -670,53 +721,6 @@ class Xp(commands.Cog):
                     file_bytes.seek(0, 0)
                     return file_bytes
 
-    def add_overlay(self, pfp, user: discord.User, img, xp: int, rank: list, txt: list, colors, levels_info, name_fnt):
-        #img = Image.new('RGBA', (card.width, card.height), color = (250,250,250,0))
-        #img.paste(pfp, (20, 29))
-        #img.paste(card, (0, 0), card)
-        cardL = img.load()
-        pfpL = pfp.load()
-        for x in range(list(img.size)[0]):
-            for y in range(img.size[1]):
-                if sqrt((x-162)**2 + (y-170)**2) < 139:
-                    cardL[x,y] = pfpL[x-20,y-29]
-                elif cardL[x, y][3]<128:
-                    cardL[x,y] = (255,255,255,0)
-                    
-        
-        xp_fnt = self.fonts['xp_fnt']
-        NIVEAU_fnt = self.fonts['NIVEAU_fnt']
-        levels_fnt = self.fonts['levels_fnt']
-        rank_fnt = self.fonts['rank_fnt']
-        RANK_fnt = self.fonts['RANK_fnt']
-        
-        img = self.add_xp_bar(img,xp-levels_info[2],levels_info[1]-levels_info[2],colors['bar'])
-        d = ImageDraw.Draw(img)
-        d.text(self.calc_pos(user.name,name_fnt,610,68), user.name, font=name_fnt, fill=colors['name'])
-        temp = '{} / {} xp ({}/{})'.format(xp-levels_info[2],levels_info[1]-levels_info[2],xp,levels_info[1])
-        d.text((self.calc_pos(temp,xp_fnt,625,237)), temp, font=xp_fnt, fill=colors['xp'])
-        d.text((380,140), txt[0], font=NIVEAU_fnt, fill=colors['NIVEAU'])
-        d.text((self.calc_pos(str(levels_info[0]),levels_fnt,740,160,'right')), str(levels_info[0]), font=levels_fnt, fill=colors['xp'])
-        temp = '{x[0]}/{x[1]}'.format(x=rank)
-        d.text((self.calc_pos(txt[1],RANK_fnt,893,147,'center')), txt[1], font=RANK_fnt, fill=colors['rank'])
-        d.text((self.calc_pos(temp,rank_fnt,893,180,'center')), temp, font=rank_fnt, fill=colors['rank'])
-        return img
-
-    def add_xp_bar(self, img, xp: int, needed_xp: int, color):
-        """Colorize the xp bar"""
-        error_rate = 25
-        data = np.array(img)   # "data" is a height x width x 4 numpy array
-        red, green, blue, alpha = data.T # Temporarily unpack the bands for readability
-
-        # Replace white with red... (leaves alpha values alone...)
-        white_areas = (abs(red)-180<error_rate) & (abs(blue)-180<error_rate) & (abs(green)-180<error_rate)
-        white_areas[:298] = False & False & False
-        max_x = round(298 + (980-298)*xp/needed_xp)
-        white_areas[max_x:] = False & False & False
-        #white_areas[298:980] = True & True & True
-        data[..., :-1][white_areas.T] = color # Transpose back needed
-        return Image.fromarray(data)
-
     async def get_xp_bar_color(self, userID:int):
         return (45,180,105)
     
@@ -780,26 +784,29 @@ class Xp(commands.Cog):
             await self.bot.get_cog('Errors').on_command_error(ctx,e)
     
     async def send_card(self, ctx: MyContext, user: discord.User, xp, rank, ranks_nb, used_system, levels_info=None):
+        style = await self.bot.get_cog('Utilities').get_xp_style(user)
+        txts = [await self.bot._(ctx.channel,'xp','card-level'), await self.bot._(ctx.channel,'xp','card-rank')]
+        static = await self.bot.get_cog('Utilities').get_db_userinfo(['animated_card'],[f'`userID`={user.id}'])
+        if user.is_avatar_animated():
+            if static is not None:
+                static = not static['animated_card']
+            else:
+                static = True
+        self.bot.log.debug("XP card for user {} ({}xp - style {})".format(user.id,xp,style))
         try:
-            myfile = discord.File('../cards/global/{}-{}-{}.{}'.format(user.id,xp,rank,'gif' if user.is_avatar_animated() else 'png'))
-        except FileNotFoundError:
-            style = await self.bot.get_cog('Utilities').get_xp_style(user)
-            txts = [await self.bot._(ctx.channel,'xp','card-level'), await self.bot._(ctx.channel,'xp','card-rank')]
-            static = await self.bot.get_cog('Utilities').get_db_userinfo(['animated_card'],[f'`userID`={user.id}'])
-            if user.is_avatar_animated():
-                if static is not None:
-                    static = not static['animated_card']
-                else:
-                    static = True
-            self.bot.log.debug("XP card for user {} ({}xp - style {})".format(user.id,xp,style))
             myfile = await self.create_card(user,style,xp,used_system,[rank,ranks_nb],txts,force_static=static,levels_info=levels_info)
-            if UsersCog := self.bot.get_cog("Users"):
-                try:
-                    await UsersCog.used_rank(user.id)
-                except Exception as e:
-                    await self.bot.get_cog("Errors").on_error(e, ctx)
-            if statsCog := self.bot.get_cog("BotStats"):
-                statsCog.xp_cards += 1
+        except RendererOverloaded:
+            self.bot.log.warning("XP card renderer is overloaded, sending a text rank instead")
+            if ctx.can_send_embed:
+                await self.send_embed(ctx,user,xp,rank,ranks_nb,levels_info,used_system)
+            else:
+                await self.send_txt(ctx,user,xp,rank,ranks_nb,levels_info,used_system)
+            return
+        if UsersCog := self.bot.get_cog("Users"):
+            try:
+                await UsersCog.used_rank(user.id)
+            except Exception as e:
+                await self.bot.get_cog("Errors").on_error(e, ctx)
         try:
             await ctx.send(file=myfile)
         except discord.errors.HTTPException:
@@ -877,27 +884,26 @@ class Xp(commands.Cog):
         else:
             xp_system_used = 0
         xp_system_used = 0 if xp_system_used is None else xp_system_used
+        members_only = False
         if xp_system_used == 0:
-            if Type == 'global':
-                if len(self.cache["global"]) == 0:
-                    await self.bdd_load_cache(-1)
-                ranks = sorted([{'userID':key, 'xp':value[1]} for key,value in self.cache['global'].items()], key=lambda x:x['xp'], reverse=True)
-                max_page = ceil(len(self.cache['global'])/20)
-            elif Type == 'guild':
-                ranks = await self.bdd_get_top(10000,guild=ctx.guild)
-                max_page = ceil(len(ranks)/20)
+            index = await self.get_ranks_index('global')
+            if Type == 'guild' and ctx.guild is not None:
+                members_only = True
+                max_page = ceil(self.count_members_ranked(index, ctx.guild)/20)
+            else:
+                max_page = ceil(len(index)/20)
         else:
             #ranks = await self.bdd_get_top(20*page,guild=ctx.guild)
-            if not ctx.guild.id in self.cache.keys():
-                await self.bdd_load_cache(ctx.guild.id)
-            ranks = sorted([{'userID':key, 'xp':value[1]} for key,value in self.cache[ctx.guild.id].items()], key=lambda x:x['xp'], reverse=True)
-            max_page = ceil(len(ranks)/20)
+            index = await self.get_ranks_index(ctx.guild.id)
+            max_page = ceil(len(index)/20)
         if page < 1:
             return await ctx.send(await self.bot._(ctx.channel,"xp",'low-page'))
         elif page > max_page:
             return await ctx.send(await self.bot._(ctx.channel,"xp",'high-page'))
-        ranks = ranks[(page-1)*20:]
-        ranks = [{'user':x['userID'],'xp':x['xp']} for x in ranks]
+        if members_only:
+            ranks = [{'user':userID,'xp':xp} for userID, xp in self.get_members_ranks(index, ctx.guild, (page-1)*20, 20)]
+        else:
+            ranks = [{'user':userID,'xp':xp} for userID, xp in index.page((page-1)*20, 20)]
         nbr = 20
         txt, i = await self.create_top_main(ranks,nbr,page,ctx,xp_system_used)
         while len("\n".join(txt)) > 1000 and nbr > 0:
@@ -928,17 +934,6 @@ class Xp(commands.Cog):
             await ctx.send(f_name+"\n\n"+'\n'.join(txt))
 
 
-    async def clear_cards(self, all: bool=False):
-        """Delete outdated rank cards"""
-        files =  os.listdir('../cards/global')
-        done = list()
-        for f in sorted([f.split('-')+['../cards/global/'+f] for f in files], key=operator.itemgetter(1), reverse=True):
-            if all or f[0] in done:
-                os.remove(f[3])
-            else:
-                done.append(f[0])
-    
-
     @commands.command(name='set_xp', aliases=["setxp", "set-xp"])
     @commands.guild_only()
     @commands.check(checks.has_admin)
@@ -963,7 +958,7 @@ class Xp(commands.Cog):
         else:
             if ctx.guild.id not in self.cache.keys():
                 await self.bdd_load_cache(ctx.guild.id)
-            self.cache[ctx.guild.id][user.id] = [round(time.time()), xp]
+            self.update_cache(ctx.guild.id, user.id, xp)
             s = "XP of user {} `{}` edited (from {} to {}) in server `{}`".format(user, user.id, prev_xp, xp, ctx.guild.id)
             self.bot.log.info(s)
             emb = self.bot.get_cog("Embeds").Embed(desc=s,color=8952255,footer_text=ctx.guild.name).update_timestamp().set_author(self.bot.user)
@@ -974,35 +969,24 @@ class Xp(commands.Cog):
 
     async def rr_add_role(self, guildID:int, roleID:int, level:int):
         """Add a role reward in the database"""
-        cnx = self.bot.cnx_frm
-        cursor = cnx.cursor(dictionary = True)
         ID = await self.gen_rr_id()
         query = "INSERT INTO `roles_rewards` (`ID`,`guild`,`role`,`level`) VALUES (%(i)s,%(g)s,%(r)s,%(l)s);"
-        cursor.execute(query, { 'i': ID, 'g': guildID, 'r': roleID, 'l': level })
-        cnx.commit()
-        cursor.close()
+        async with self.bot.db.acquire() as cnx:
+            await cnx.execute(query, { 'i': ID, 'g': guildID, 'r': roleID, 'l': level })
         return True
     
     async def rr_list_role(self, guild:int, level:int=-1):
         """List role rewards in the database"""
-        cnx = self.bot.cnx_frm
-        cursor = cnx.cursor(dictionary = True)
         query = ("SELECT * FROM `roles_rewards` WHERE guild={g} ORDER BY level;".format(g=guild)) if level < 0 else ("SELECT * FROM `roles_rewards` WHERE guild={g} AND level={l} ORDER BY level;".format(g=guild,l=level))
-        cursor.execute(query)
-        liste = list()
-        for x in cursor:
-            liste.append(x)
-        cursor.close()
+        async with self.bot.db.acquire() as cnx:
+            liste = await cnx.fetch(query)
         return liste
     
     async def rr_remove_role(self, ID:int):
         """Remove a role reward from the database"""
-        cnx = self.bot.cnx_frm
-        cursor = cnx.cursor(dictionary = True)
         query = ("DELETE FROM `roles_rewards` WHERE `ID`={};".format(ID))
-        cursor.execute(query)
-        cnx.commit()
-        cursor.close()
+        async with self.bot.db.acquire() as cnx:
+            await cnx.execute(query)
         return True
 
     @commands.group(name="roles_rewards", aliases=['rr'])
@@ -1094,7 +1078,7 @@ class Xp(commands.Cog):
                 return
             used_system = await self.bot.get_config(ctx.guild.id,'xp_type')
             used_system = 0 if used_system is None else used_system
-            xps = [{'user':x['userID'],'xp':x['xp']} for x in await self.bdd_get_top(top=None, guild=ctx.guild if used_system > 0 else None)]
+            xps = [{'user':x['userID'],'xp':x['xp']} for x in await self.bdd_get_top(top=None, guild=ctx.guild)]
             for member in xps:
                 m = ctx.guild.get_member(member['user'])
                 if m is not None:
@@ -0,0 +1,77 @@
+import asyncio
+import time
+import typing
+from collections import OrderedDict
+
+import aiohttp
+
+
+class AssetsCache:
+    """A byte cache for downloaded images (avatars, emojis, attachments), with a TTL and a memory cap
+    Keys are the asset URLs, which contain the Discord asset hash and the requested size and format"""
+
+    def __init__(self, ttl: int = 600, max_size: int = 64*1024**2):
+        self.ttl = ttl # seconds
+        self.max_size = max_size # bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._cache: typing.OrderedDict[str, typing.Tuple[float, bytes]] = OrderedDict()
+        self._pending: typing.Dict[str, asyncio.Future] = dict()
+
+    def get(self, url: str) -> typing.Optional[bytes]:
+        """Get a cached asset if it's not expired"""
+        if url not in self._cache:
+            return None
+        date, data = self._cache[url]
+        if date + self.ttl < time.time():
+            self._remove(url)
+            return None
+        self._cache.move_to_end(url)
+        return data
+
+    def set(self, url: str, data: bytes):
+        if len(data) > self.max_size:
+            return
+        self._remove(url)
+        self._cache[url] = (time.time(), data)
+        self.size += len(data)
+        while self.size > self.max_size:
+            self._remove(next(iter(self._cache)))
+
+    def _remove(self, url: str):
+        if url in self._cache:
+            self.size -= len(self._cache.pop(url)[1])
+
+    async def fetch(self, session: aiohttp.ClientSession, url: str) -> bytes:
+        """Download an asset, or get it from the cache
+        Simultaneous requests for the same asset share the same download"""
+        url = str(url)
+        data = self.get(url)
+        if data is not None:
+            self.hits += 1
+            return data
+        if url in self._pending:
+            self.hits += 1
+            return await asyncio.shield(self._pending[url])
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending[url] = future
+        try:
+            async with session.get(url) as resp:
+                resp.raise_for_status()
+                data = await resp.read()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # don't warn about an exception nobody was waiting for
+            future.exception()
+            raise
+        else:
+            self.set(url, data)
+            future.set_result(data)
+            return data
+        finally:
+            del self._pending[url]
@@ -1,114 +1,49 @@
 # -*- coding: utf-8 -*-
 
 import io
-import math
 
-import discord
+import numpy as np
 from PIL import Image, ImageSequence
 
+from libs.gif_frames import gif_frames_info, iter_gif_frames, save_gif_frames
+from libs.image_file import ImageFile
 
-# source: https://dev.to/enzoftware/how-to-build-amazing-image-filters-with-python-median-filter---sobel-filter---5h7
-def edge_antialiasing(img):
-    new_img = Image.new("RGB", img.size, "black")
-    for x in range(1, img.width - 1):  # ignore the edge pixels for simplicity (1 to width-1)
-        for y in range(1, img.height - 1):  # ignore edge pixels for simplicity (1 to height-1)
-
-            # initialise Gx to 0 and Gy to 0 for every pixel
-            Gx = 0
-            Gy = 0
-
-            # top left pixel
-            p = img.getpixel((x - 1, y - 1))
-            r = p[0]
-            g = p[1]
-            b = p[2]
-
-            # intensity ranges from 0 to 765 (255 * 3)
-            intensity = r + g + b
-
-            # accumulate the value into Gx, and Gy
-            Gx += -intensity
-            Gy += -intensity
-
-            # remaining left column
-            p = img.getpixel((x - 1, y))
-            r = p[0]
-            g = p[1]
-            b = p[2]
-
-            Gx += -2 * (r + g + b)
-
-            p = img.getpixel((x - 1, y + 1))
-            r = p[0]
-            g = p[1]
-            b = p[2]
-
-            Gx += -(r + g + b)
-            Gy += (r + g + b)
-
-            # middle pixels
-            p = img.getpixel((x, y - 1))
-            r = p[0]
-            g = p[1]
-            b = p[2]
-
-            Gy += -2 * (r + g + b)
-
-            p = img.getpixel((x, y + 1))
-            r = p[0]
-            g = p[1]
-            b = p[2]
-
-            Gy += 2 * (r + g + b)
-
-            # right column
-            p = img.getpixel((x + 1, y - 1))
-            r = p[0]
-            g = p[1]
-            b = p[2]
-
-            Gx += (r + g + b)
-            Gy += -(r + g + b)
-
-            p = img.getpixel((x + 1, y))
-            r = p[0]
-            g = p[1]
-            b = p[2]
-
-            Gx += 2 * (r + g + b)
-
-            p = img.getpixel((x + 1, y + 1))
-            r = p[0]
-            g = p[1]
-            b = p[2]
-
-            Gx += (r + g + b)
-            Gy += (r + g + b)
-
-            # calculate the length of the gradient (Pythagorean theorem)
-            length = math.sqrt((Gx * Gx) + (Gy * Gy))
-
-            # normalise the length of gradient to the range 0 to 255
-            length = length / 4328 * 255
-
-            length = int(length)
 
-            # draw the length in the edge image
-            new_img.putpixel((x, y), (length, length, length))
-    return new_img
+# Sobel filter, source: https://dev.to/enzoftware/how-to-build-amazing-image-filters-with-python-median-filter---sobel-filter---5h7
+def edge_antialiasing(img):
+    # intensity ranges from 0 to 765 (255 * 3)
+    intensity = np.asarray(img.convert('RGB'), dtype=np.int32).sum(axis=2)
+    top_left, top, top_right = intensity[:-2, :-2], intensity[:-2, 1:-1], intensity[:-2, 2:]
+    left, right = intensity[1:-1, :-2], intensity[1:-1, 2:]
+    bottom_left, bottom, bottom_right = intensity[2:, :-2], intensity[2:, 1:-1], intensity[2:, 2:]
+    Gx = (top_right + 2 * right + bottom_right) - (top_left + 2 * left + bottom_left)
+    Gy = (bottom_left + 2 * bottom + bottom_right) - (top_left + 2 * top + top_right)
+    # length of the gradient, normalised to the range 0 to 255
+    length = (np.sqrt(Gx * Gx + Gy * Gy) / 4328 * 255).astype(np.uint8)
+    # edge pixels are ignored for simplicity and stay black
+    new_img = np.zeros(intensity.shape + (3,), dtype=np.uint8)
+    new_img[1:-1, 1:-1] = length[..., np.newaxis]
+    return Image.fromarray(new_img, 'RGB')
 
 
 def place_edges(img, edge_img, modifiers):
     edge_img_minimum = 10
-    edge_img_maximum = edge_img.crop().getextrema()[0][1]
-    for x in range(1, img.width - 1):
-        for y in range(1, img.height - 1):
-            p = img.getpixel((x, y))
-            ep = edge_img.getpixel((x, y))
-            if (ep[0] > edge_img_minimum):
-                img.putpixel((x, y), edge_colorify((ep[0] - edge_img_minimum) / (edge_img_maximum - edge_img_minimum),
-                                                   modifiers['colors'], p))
-    return img
+    edges = np.asarray(edge_img, dtype=np.int32)[..., 0]
+    edge_img_maximum = edges.max()
+    mask = edges > edge_img_minimum
+    if not mask.any():
+        return img
+    data = np.array(img.convert('RGBA'))
+    pixels = data[mask][:, :3].astype(np.int32)
+    colors = np.array(modifiers['colors'], dtype=np.int32)
+    # the closest theme color of each pixel decides which gradient is used
+    distances = np.stack([colors_distance(pixels, color) for color in colors], axis=1)
+    closest = np.where(distances.max(axis=1) > 0, distances.argmax(axis=1), 2)
+    start = colors[[0, 1, 2]][closest]
+    end = colors[[1, 2, 1]][closest]
+    x = (edges[mask] - edge_img_minimum) / (edge_img_maximum - edge_img_minimum)
+    data[mask] = np.column_stack((np.round((end - start) * x[:, np.newaxis] + start), np.full(len(x), 255))).astype(np.uint8)
+    return Image.fromarray(data, 'RGBA')
 
 
 def f(x, n, d, m, l):
@@ -151,29 +86,10 @@ def f2(x, n, colors, variation):
         return colors[2][n]
 
 
-def f3(x, n, colors, cur_color):
-    array = []
-
-    for i in range(len(colors)):
-        array.append(distance_to_color(colors[i], cur_color))
-
-    closest_color = find_max_index(array)
-    if closest_color == 0:
-        return interpolate(colors[0][n], colors[1][n], x)
-    elif closest_color == 1:
-        return interpolate(colors[1][n], colors[2][n], x)
-    else:
-        return interpolate(colors[2][n], colors[1][n], x)
-
-
 def colorify(x, colors, variation):
     return tuple(f2(x, i, colors, variation) for i in range(3))
 
 
-def edge_colorify(x, colors, cur_color):
-    return tuple(f3(x, i, colors, cur_color) for i in range(3))
-
-
 def remove_alpha(img, bg):
     alpha = img.convert('RGBA').getchannel('A')
     background = Image.new("RGBA", img.size, bg)
@@ -181,24 +97,21 @@ def remove_alpha(img, bg):
     return background
 
 
+def apply_lut(img, results):
+    """Colorize an image from its luminance, with a table of 256 RGB colors"""
+    pixels = np.asarray(img.convert('LA'))
+    lut = np.array([color if isinstance(color, tuple) else (0, 0, 0) for color in results], dtype=np.uint8)
+    return Image.fromarray(np.dstack((lut[pixels[..., 0]], pixels[..., 1])), 'RGBA')
+
+
 def blurple_filter(img, modifier, variation, maximum, minimum):
-    img = img.convert('LA')
-    pixels = img.getdata()
-    img = img.convert('RGBA')
     results = [modifier['func']((x - minimum) * 255 / (255 - minimum)) if x >= minimum else 0 for x in range(256)]
-
-    img.putdata((*map(lambda x: results[x[0]] + (x[1],), pixels),))
-    return img
+    return apply_lut(img, results)
 
 
 def blurplefy(img, modifier, variation, maximum, minimum):
-    img = img.convert('LA')
-    pixels = img.getdata()
-    img = img.convert('RGBA')
-    results = [colorify((x - minimum) / (maximum - minimum), modifier['colors'], variation) if x >= minimum else 0 for x
-               in range(256)]
-    img.putdata((*map(lambda x: results[x[0]] + (x[1],), pixels),))
-    return img
+    results = [colorify((x - minimum) / (maximum - minimum), modifier['colors'], variation) if x >= minimum else 0 for x in range(256)]
+    return apply_lut(img, results)
 
 
 def variation_maker(base, var):
@@ -236,50 +149,33 @@ def interpolate_colors(color1, color2, x):
     return tuple(new_color)
 
 
-def distance_to_color(color1, color2):
+def colors_distance(pixels, color):
+    """Similarity (from 0 to 1) between an array of RGB pixels and a color"""
     total = 0
     for i in range(3):
-        total += (255 - abs(color1[i] - color2[i])) / 255
+        total = total + (255 - np.abs(pixels[:, i] - color[i])) / 255
     return total / 3
 
 
-def find_max_index(array):
-    maximum = 0
-    closest = None
-    for i in range(len(array)):
-        if array[i] > maximum:
-            maximum = array[i]
-            closest = i
-    return closest
-
-
 def color_ratios(img, colors):
-    img = img.convert('RGBA')
-    total_pixels = img.width * img.height
-    color_pixels = [0, 0, 0, 0]
+    data = np.asarray(img.convert('RGBA'), dtype=np.int32).reshape(-1, 4)
+    # transparent pixels are ignored
+    pixels = data[data[:, 3] != 0][:, :3]
+    total_pixels = len(pixels)
     close_colors = []
     for i in range(3):
         close_colors.append(interpolate_colors(colors[i], colors[min(i + 1, 2)], .33))
         close_colors.append(interpolate_colors(colors[i], colors[max(i - 1, 0)], .33))
 
-    for x in range(0, img.width):
-        for y in range(0, img.height):
-            p = img.getpixel((x, y))
-            if p[3] == 0:
-                total_pixels -= 1
-                continue
-            values = [0, 0, 0]
-            for i in range(3):
-                values[i] = max(
-                    distance_to_color(p, colors[i]),
-                    distance_to_color(p, close_colors[2 * i]),
-                    distance_to_color(p, close_colors[2 * i + 1])
-                )
-            index = find_max_index(values)
-            if values[index] > .93:
-                color_pixels[index] += 1
-            else:
-                color_pixels[3] += 1
+    values = np.stack([np.maximum.reduce([
+        colors_distance(pixels, colors[i]),
+        colors_distance(pixels, close_colors[2 * i]),
+        colors_distance(pixels, close_colors[2 * i + 1])
+    ]) for i in range(3)], axis=1)
+    index = values.argmax(axis=1)
+    matching = values.max(axis=1) > .93
+    color_pixels = np.bincount(index[matching], minlength=3).tolist()
+    color_pixels.append(total_pixels - sum(color_pixels))
 
     percent = [0, 0, 0, 0]
     for i in range(4):
@@ -339,7 +235,9 @@ VARIATIONS = {
 }
 
 
-async def convert_image(image, modifier, method, variations):
+def convert_image(image, modifier, method, variations, max_frames=None):
+    """Convert an image with a filter
+    Animated images are decoded frame by frame, and reduced to max_frames frames if needed"""
     try:
         modifier_converter = dict(MODIFIERS[modifier])
     except KeyError:
@@ -378,37 +276,23 @@ async def convert_image(image, modifier, method, variations):
 
     with Image.open(io.BytesIO(image)) as img:
         if img.format == "GIF":
-            frames = []
-            durations = []
             try:
                 loop = img.info['loop']
             except KeyError:
                 loop = None
 
-            minimum = 256
-            maximum = 0
-
-            for img_frame in ImageSequence.Iterator(img):
-                frame = img_frame.convert('LA')
-
-                if frame.getextrema()[0][0] < minimum:
-                    minimum = frame.getextrema()[0][0]
-
-                if frame.getextrema()[0][1] > maximum:
-                    maximum = frame.getextrema()[0][1]
-
-            for frame in ImageSequence.Iterator(img):
-                new_frame = method_converter(frame, modifier_converter, variation_converter, maximum, minimum)
-                if background_color is not None:
-                    new_frame = remove_alpha(new_frame, background_color)
+            durations, step, (minimum, maximum) = gif_frames_info(img, max_frames)
 
-                durations.append(frame.info.get('duration',100))
-                frames.append(new_frame)
+            def convert_frames():
+                for frame in iter_gif_frames(img, step):
+                    new_frame = method_converter(frame, modifier_converter, variation_converter, maximum, minimum)
+                    if background_color is not None:
+                        new_frame = remove_alpha(new_frame, background_color)
+                    yield new_frame
 
             out = io.BytesIO()
             try:
-                frames[0].save(out, format='GIF', append_images=frames[1:], save_all=True, loop=loop,
-                               duration=durations)
+                save_gif_frames(convert_frames(), out, loop=loop, duration=durations)
             except TypeError as e:
                 print(e)
                 raise RuntimeError('Invalid GIF.')
@@ -428,11 +312,10 @@ async def convert_image(image, modifier, method, variations):
             img.save(out, format='png')
             filename = f'{modifier}.png'
 
-    out.seek(0)
-    return discord.File(out, filename=filename)
+    return ImageFile(out.getvalue(), filename)
 
 
-async def check_image(image, modifier, method):
+def check_image(image, modifier, method):
     try:
         modifier_converter = MODIFIERS[modifier]
     except KeyError:
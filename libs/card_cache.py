@@ -0,0 +1,108 @@
+import hashlib
+import logging
+import os
+import re
+import typing
+from collections import OrderedDict
+
+
+class CardCache:
+    """A size-bounded LRU cache of rendered rank cards, keyed by a hash of everything drawn on them
+    Cards are kept in memory, and optionally in a disk directory used as a second, bigger tier"""
+
+    FILENAME = re.compile(r'^[0-9a-f]{40}\.(png|gif)$') # files created by the cache
+
+    def __init__(self, max_memory: int = 32*1024**2, disk_dir: typing.Optional[str] = None, max_disk: int = 256*1024**2, log: logging.Logger = None):
+        self.max_memory = max_memory # bytes
+        self.max_disk = max_disk # bytes
+        self.disk_dir = disk_dir
+        self.log = log or logging.getLogger("runner")
+        self.memory: typing.OrderedDict[str, bytes] = OrderedDict()
+        self.memory_size = 0
+        self.disk: typing.OrderedDict[str, int] = OrderedDict() # filename -> size
+        self.disk_size = 0
+        self.hits = 0
+        self.misses = 0
+        if disk_dir is not None:
+            self._load_disk()
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        """Hash the card parameters into a key"""
+        return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+    def _load_disk(self):
+        """Index the cards already saved on disk, oldest first
+        Other files of the directory are never used nor removed"""
+        os.makedirs(self.disk_dir, exist_ok=True)
+        files = list()
+        for entry in os.scandir(self.disk_dir):
+            if entry.is_file() and self.FILENAME.match(entry.name):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(files):
+            self.disk[name] = size
+            self.disk_size += size
+        count = len(self.disk)
+        self._evict_disk()
+        self.log.info(f"[cards] {len(self.disk)} cards found in {self.disk_dir}, {count - len(self.disk)} removed to respect the size limit")
+
+    def _evict_memory(self):
+        while self.memory_size > self.max_memory and len(self.memory) > 0:
+            _, data = self.memory.popitem(last=False)
+            self.memory_size -= len(data)
+
+    def _evict_disk(self):
+        while self.disk_size > self.max_disk and len(self.disk) > 0:
+            name, size = self.disk.popitem(last=False)
+            self.disk_size -= size
+            try:
+                os.remove(os.path.join(self.disk_dir, name))
+            except OSError:
+                pass
+
+    def _store_memory(self, key: str, data: bytes):
+        if len(data) > self.max_memory:
+            return
+        self.memory[key] = data
+        self.memory_size += len(data)
+        self._evict_memory()
+
+    def get(self, key: str, ext: str) -> typing.Optional[bytes]:
+        """Get a cached card, or None"""
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.hits += 1
+            return self.memory[key]
+        name = f"{key}.{ext}"
+        if name in self.disk:
+            try:
+                with open(os.path.join(self.disk_dir, name), 'rb') as f:
+                    data = f.read()
+            except OSError:
+                self.disk_size -= self.disk.pop(name)
+            else:
+                self.disk.move_to_end(name)
+                self._store_memory(key, data)
+                self.hits += 1
+                return data
+        self.misses += 1
+        return None
+
+    def set(self, key: str, ext: str, data: bytes):
+        """Save a freshly rendered card"""
+        if key in self.memory:
+            self.memory_size -= len(self.memory.pop(key))
+        self._store_memory(key, data)
+        if self.disk_dir is None or len(data) > self.max_disk:
+            return
+        name = f"{key}.{ext}"
+        try:
+            with open(os.path.join(self.disk_dir, name), 'wb') as f:
+                f.write(data)
+        except OSError as e:
+            self.log.warning(f"[cards] Unable to save a card on disk: {e}")
+            return
+        self.disk_size += len(data) - self.disk.pop(name, 0)
+        self.disk[name] = len(data)
+        self._evict_disk()
@@ -0,0 +1,43 @@
+import asyncio
+import collections
+import typing
+
+Job = typing.Callable[[], typing.Awaitable]
+
+
+class ChannelQueues:
+    """Run sending jobs in the background, with one queue per channel
+    Jobs of a channel run one at a time and in order (one Discord rate-limit bucket per channel),
+    while different channels are handled concurrently, up to `max_concurrent` jobs at a time"""
+
+    def __init__(self, max_concurrent: int = 10, on_error: typing.Optional[typing.Callable[[Exception], typing.Awaitable]] = None):
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.on_error = on_error
+        self.queues: typing.Dict[int, typing.Deque[Job]] = dict()
+        self.workers: typing.Dict[int, asyncio.Task] = dict()
+
+    def put(self, channel_id: int, job: Job):
+        """Add a job at the end of a channel queue"""
+        self.queues.setdefault(channel_id, collections.deque()).append(job)
+        if channel_id not in self.workers:
+            self.workers[channel_id] = asyncio.ensure_future(self._drain(channel_id))
+
+    def pending(self) -> int:
+        """Number of jobs waiting to be run"""
+        return sum(len(queue) for queue in self.queues.values())
+
+    async def _drain(self, channel_id: int):
+        queue = self.queues[channel_id]
+        try:
+            while len(queue) > 0:
+                job = queue.popleft()
+                async with self.semaphore:
+                    try:
+                        await job()
+                    except Exception as e:
+                        if self.on_error is not None:
+                            await self.on_error(e)
+        finally:
+            del self.workers[channel_id]
+            if len(queue) == 0:
+                del self.queues[channel_id]
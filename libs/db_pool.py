@@ -0,0 +1,164 @@
+import asyncio
+import contextlib
+import logging
+import time
+import typing
+from concurrent.futures import ThreadPoolExecutor
+
+import mysql.connector
+from mysql.connector.errors import InterfaceError, OperationalError
+
+
+class PooledConnection:
+    """A MySQL connection borrowed from a DatabasePool
+    Every query is run inside the pool executor, so the event loop is never blocked"""
+
+    def __init__(self, pool: "DatabasePool", cnx: mysql.connector.connection.MySQLConnection):
+        self.pool = pool
+        self.cnx = cnx
+
+    async def _run(self, func: typing.Callable, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.pool.executor, func, *args)
+
+    def _execute(self, query: str, args, dictionary: bool, fetch: bool, many: bool = False):
+        cursor = self.cnx.cursor(dictionary=dictionary, buffered=True)
+        try:
+            if many:
+                cursor.executemany(query, args)
+            else:
+                cursor.execute(query, args)
+            if fetch:
+                return list(cursor) if cursor.with_rows else list()
+            return cursor.lastrowid or cursor.rowcount
+        finally:
+            cursor.close()
+
+    async def fetch(self, query: str, args=None, dictionary: bool = True) -> list:
+        """Run a SELECT query and return every row"""
+        return await self._run(self._execute, query, args, dictionary, True)
+
+    async def fetchone(self, query: str, args=None, dictionary: bool = True):
+        """Run a SELECT query and return the first row, or None"""
+        rows = await self.fetch(query, args, dictionary)
+        return rows[0] if len(rows) > 0 else None
+
+    async def execute(self, query: str, args=None) -> int:
+        """Run a writing query and return the last inserted ID, or the number of affected rows"""
+        return await self._run(self._execute, query, args, False, False)
+
+    async def executemany(self, query: str, seq_args: typing.Sequence) -> int:
+        """Run the same writing query for each set of arguments"""
+        return await self._run(self._execute, query, seq_args, False, False, True)
+
+    async def begin(self):
+        """Start a transaction, which will be ended by commit() or rollback()"""
+        await self._run(self.cnx.start_transaction)
+
+    async def commit(self):
+        await self._run(self.cnx.commit)
+
+    async def rollback(self):
+        await self._run(self.cnx.rollback)
+
+
+class DatabasePool:
+    """A pool of MySQL connections to one database
+    Connections are created lazily, checked before being reused, and replaced when broken"""
+
+    def __init__(self, name: str, connect_kwargs: dict, size: int = 5, health_check_delay: int = 60, log: logging.Logger = None):
+        self.name = name
+        self.connect_kwargs = dict(connect_kwargs, autocommit=True)
+        self.size = size
+        self.health_check_delay = health_check_delay # seconds of inactivity before pinging a connection again
+        self.log = log or logging.getLogger("runner")
+        self.executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix=f"db-{name}")
+        self._idle: typing.List[typing.Tuple[mysql.connector.connection.MySQLConnection, float]] = list()
+        self._semaphore: typing.Optional[asyncio.Semaphore] = None
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # created lazily, to be bound to the running loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.size)
+        return self._semaphore
+
+    def _connect(self) -> mysql.connector.connection.MySQLConnection:
+        self.log.debug(f"[db] New connection to pool {self.name}")
+        return mysql.connector.connect(**self.connect_kwargs)
+
+    def _check(self, cnx: mysql.connector.connection.MySQLConnection) -> mysql.connector.connection.MySQLConnection:
+        """Make sure a connection is still alive, or replace it"""
+        try:
+            cnx.ping(reconnect=True, attempts=2, delay=1)
+            return cnx
+        except (InterfaceError, OperationalError) as e:
+            self.log.warning(f"[db] Dropping a broken connection from pool {self.name}: {e}")
+            self._close(cnx)
+            return self._connect()
+
+    @staticmethod
+    def _close(cnx: mysql.connector.connection.MySQLConnection):
+        try:
+            cnx.close()
+        except Exception:
+            pass
+
+    async def _get_connection(self) -> mysql.connector.connection.MySQLConnection:
+        loop = asyncio.get_running_loop()
+        if len(self._idle) == 0:
+            return await loop.run_in_executor(self.executor, self._connect)
+        cnx, last_use = self._idle.pop()
+        if last_use + self.health_check_delay < time.time():
+            cnx = await loop.run_in_executor(self.executor, self._check, cnx)
+        return cnx
+
+    def _release(self, cnx: mysql.connector.connection.MySQLConnection):
+        if cnx.in_transaction:
+            # unfinished transactions should never leak into the next user
+            cnx.rollback()
+        self._idle.append((cnx, time.time()))
+
+    @contextlib.asynccontextmanager
+    async def acquire(self) -> typing.AsyncIterator[PooledConnection]:
+        """Borrow a connection from the pool
+        Waits if every connection is already in use"""
+        async with self.semaphore:
+            cnx = await self._get_connection()
+            try:
+                yield PooledConnection(self, cnx)
+            except (InterfaceError, OperationalError):
+                # the connection is probably dead: don't give it back
+                await asyncio.get_running_loop().run_in_executor(self.executor, self._close, cnx)
+                raise
+            except BaseException:
+                await asyncio.get_running_loop().run_in_executor(self.executor, self._release, cnx)
+                raise
+            else:
+                await asyncio.get_running_loop().run_in_executor(self.executor, self._release, cnx)
+
+    def close(self):
+        """Close every idle connection and stop the executor"""
+        while len(self._idle) > 0:
+            self._close(self._idle.pop()[0])
+        self.executor.shutdown(wait=False)
+
+
+class DatabaseManager:
+    """Hold one pool per database used by the bot
+    Usage: `async with bot.db.acquire('xp') as cnx: await cnx.fetch(...)`"""
+
+    def __init__(self, keys: dict, size: int = 5, log: logging.Logger = None):
+        base = {'user': keys['user'], 'password': keys['password'], 'host': keys['host'], 'charset': 'utf8mb4', 'collation': 'utf8mb4_unicode_ci'}
+        self.pools: typing.Dict[str, DatabasePool] = {
+            'frm': DatabasePool('frm', dict(base, database=keys['database1']), size, log=log),
+            'xp': DatabasePool('xp', dict(base, database=keys['database2']), size, log=log),
+            'stats': DatabasePool('stats', dict(base, database='statsbot'), 2, log=log)
+        }
+
+    def acquire(self, name: str = 'frm') -> typing.AsyncContextManager[PooledConnection]:
+        """Borrow a connection to one of the databases (frm, xp or stats)"""
+        return self.pools[name].acquire()
+
+    def close(self):
+        for pool in self.pools.values():
+            pool.close()
@@ -0,0 +1,40 @@
+import typing
+
+from PIL import Image, ImageSequence
+
+
+def gif_frames_info(img: Image.Image, max_frames: typing.Optional[int] = None, extrema: bool = True):
+    """Read an animated image once to get the frames durations, and optionally its luminance extrema
+    If max_frames is set, only one frame every `step` frames will be kept, and its duration is extended to cover the skipped ones
+    Return (durations, step, (minimum, maximum))"""
+    durations = []
+    minimum, maximum = 256, 0
+    for frame in ImageSequence.Iterator(img):
+        durations.append(frame.info.get('duration', 100))
+        # no need to convert the next frames once the full range is reached
+        if extrema and (minimum > 0 or maximum < 255):
+            frame_min, frame_max = frame.convert('L').getextrema()
+            minimum = min(minimum, frame_min)
+            maximum = max(maximum, frame_max)
+    step = 1
+    if max_frames is not None and len(durations) > max_frames:
+        step = -(-len(durations) // max_frames)
+        durations = [sum(durations[i:i+step]) for i in range(0, len(durations), step)]
+    return durations, step, (minimum, maximum)
+
+
+def iter_gif_frames(img: Image.Image, step: int = 1) -> typing.Iterator[Image.Image]:
+    """Iterate over the frames of an animated image, keeping one frame every `step` frames
+    Frames are decoded one at a time and must be used before asking for the next one"""
+    for i, frame in enumerate(ImageSequence.Iterator(img)):
+        if i % step == 0:
+            yield frame
+
+
+def save_gif_frames(frames: typing.Iterable[Image.Image], out, **params):
+    """Encode frames into a GIF file
+    Pillow keeps every frame until the whole file is written, so the memory used grows with the frames count:
+    callers should reduce long animations with the `max_frames` option of gif_frames_info"""
+    frames = iter(frames)
+    first = next(frames)
+    first.save(out, format='GIF', save_all=True, append_images=frames, **params)
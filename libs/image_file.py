@@ -0,0 +1,7 @@
+import typing
+
+
+class ImageFile(typing.NamedTuple):
+    """An encoded image made by an image filter, sent to Discord as a file by the bot (see libs.image_jobs)"""
+    data: bytes
+    filename: str
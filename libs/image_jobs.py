@@ -0,0 +1,156 @@
+import asyncio
+import io
+import typing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import discord
+from PIL import Image
+
+from libs.image_file import ImageFile
+
+
+class ImageJobError(RuntimeError):
+    """Raised when an image can't be processed (too big, too long...)"""
+    pass
+
+
+def run_image_job(func: typing.Callable, image: bytes, max_pixels: int, max_frames: int, *args):
+    """Check the image size, then run an image filter inside a worker process
+    ImageFile results are sent back as raw bytes, to be rebuilt as discord.File by the bot"""
+    with Image.open(io.BytesIO(image)) as img:
+        if img.width * img.height > max_pixels:
+            raise ImageJobError(f"This image is too big (max {max_pixels} pixels)")
+        if getattr(img, 'n_frames', 1) > max_frames:
+            raise ImageJobError(f"This image has too many frames (max {max_frames})")
+    result = func(image, *args)
+    if isinstance(result, ImageFile):
+        return ('file', result.data, result.filename)
+    return ('value', result)
+
+
+class ImageJobQueue:
+    """Run image filters in a pool of processes, so they never slow down the bot loop
+    Jobs wait in a FIFO queue, with a global and a per-guild limit of running jobs"""
+
+    def __init__(self, workers: int = 2, per_guild: int = 1, timeout: int = 60, max_pixels: int = 2048*2048, max_frames: int = 200, update_delay: int = 3):
+        self.workers = workers
+        self.per_guild = per_guild
+        self.timeout = timeout # seconds
+        self.max_pixels = max_pixels
+        self.max_frames = max_frames
+        self.update_delay = update_delay # seconds between two queue position checks
+        self.executor = self._create_executor()
+        self.running = 0
+        self.running_per_guild: typing.Counter[typing.Optional[int]] = Counter()
+        self.waiting: typing.List[typing.Tuple[typing.Optional[int], asyncio.Future]] = list()
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.workers)
+
+    def _recycle(self, executor: ProcessPoolExecutor):
+        """Replace a broken pool (or one with a stuck worker) by a fresh one for the next jobs
+        The jobs still running in the old pool are not interrupted: its workers stop once they are done"""
+        if executor is self.executor:
+            self.executor = self._create_executor()
+        executor.shutdown(wait=False)
+
+    def _can_start(self, guild_id: typing.Optional[int]) -> bool:
+        return self.running < self.workers and (guild_id is None or self.running_per_guild[guild_id] < self.per_guild)
+
+    def _dispatch(self):
+        """Give free slots to the first waiting jobs allowed to run"""
+        for entry in list(self.waiting):
+            if self.running >= self.workers:
+                break
+            guild_id, ticket = entry
+            if ticket.done():
+                self.waiting.remove(entry)
+            elif self._can_start(guild_id):
+                self.waiting.remove(entry)
+                self.running += 1
+                self.running_per_guild[guild_id] += 1
+                ticket.set_result(None)
+
+    def _release(self, guild_id: typing.Optional[int]):
+        self.running -= 1
+        self.running_per_guild[guild_id] -= 1
+        if self.running_per_guild[guild_id] <= 0:
+            del self.running_per_guild[guild_id]
+        self._dispatch()
+
+    def position(self, ticket: asyncio.Future) -> int:
+        """Position of a job in the queue (starting from 1), or 0 if it's not waiting"""
+        for i, (_, fut) in enumerate(self.waiting, start=1):
+            if fut is ticket:
+                return i
+        return 0
+
+    async def _wait_slot(self, guild_id: typing.Optional[int], on_position: typing.Optional[typing.Callable[[int], typing.Awaitable]]):
+        ticket = asyncio.get_running_loop().create_future()
+        self.waiting.append((guild_id, ticket))
+        self._dispatch()
+        last_position = 0
+        try:
+            while not ticket.done():
+                position = self.position(ticket)
+                if on_position is not None and position != last_position:
+                    await on_position(position)
+                    last_position = position
+                await asyncio.wait([ticket], timeout=self.update_delay)
+            if last_position != 0 and on_position is not None:
+                await on_position(0)
+        except BaseException:
+            if ticket.done():
+                # we got a slot but won't use it
+                self._release(guild_id)
+            else:
+                ticket.cancel()
+                self._dispatch()
+            raise
+
+    async def submit(self, func: typing.Callable, image: bytes, *args, guild_id: typing.Optional[int] = None,
+                     on_position: typing.Optional[typing.Callable[[int], typing.Awaitable]] = None):
+        """Run an image filter `func(image, *args)` in a worker process and return its result
+        on_position is awaited with the job position in the queue each time it changes, then with 0 when the job starts
+        Raise ImageJobError if the image is too big or if the job takes too long"""
+        await self._wait_slot(guild_id, on_position)
+        executor = self.executor
+        try:
+            future = asyncio.get_running_loop().run_in_executor(executor, run_image_job, func, image, self.max_pixels, self.max_frames, *args)
+        except BrokenProcessPool:
+            self._recycle(executor)
+            self._release(guild_id)
+            raise ImageJobError("The image processing crashed, please try again")
+        except BaseException:
+            self._release(guild_id)
+            raise
+        released = False
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self._release(guild_id)
+        def on_done(fut: asyncio.Future):
+            if not fut.cancelled() and isinstance(fut.exception(), BrokenProcessPool):
+                # a worker died: start a fresh pool for the next jobs
+                self._recycle(executor)
+            release()
+        # the slot is freed once the worker is done, or when the job times out
+        future.add_done_callback(on_done)
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            # only this job fails: the next ones go to a fresh pool, while the stuck worker finishes in the old one
+            self._recycle(executor)
+            release()
+            raise ImageJobError(f"This image took too long to process (more than {self.timeout}s)")
+        except BrokenProcessPool:
+            raise ImageJobError("The image processing crashed, please try again")
+        if result[0] == 'file':
+            return discord.File(io.BytesIO(result[1]), filename=result[2])
+        return result[1]
+
+    def close(self):
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,179 @@
+import asyncio
+import glob
+import io
+import os
+import typing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageEnhance, ImageFont
+
+from libs.gif_frames import gif_frames_info, iter_gif_frames, save_gif_frames
+
+CARDS_MODELS_DIR = '../cards/model'
+
+# Worker-side caches, filled once per process by init_worker
+_templates: typing.Dict[str, Image.Image] = dict()
+_fonts: typing.Dict[str, ImageFont.FreeTypeFont] = dict()
+_circle_masks: typing.Dict[typing.Tuple[int, int], np.ndarray] = dict()
+
+
+class RendererOverloaded(Exception):
+    """Raised when too many rank cards are already waiting to be rendered"""
+    pass
+
+
+def init_worker(models_dir: str = CARDS_MODELS_DIR):
+    """Preload every card template, every font and the circle mask inside a worker process"""
+    for path in glob.glob(os.path.join(models_dir, '*.png')):
+        with Image.open(path) as im:
+            _templates[os.path.splitext(os.path.basename(path))[0]] = im.convert('RGBA')
+    try:
+        verdana_name = 'Verdana.ttf'
+        xp_font = ImageFont.truetype(verdana_name, 24)
+    except OSError:
+        verdana_name = 'Veranda.ttf'
+        xp_font = ImageFont.truetype(verdana_name, 24)
+    _fonts.update({'xp_fnt': xp_font,
+        'NIVEAU_fnt': ImageFont.truetype(verdana_name, 42),
+        'levels_fnt': ImageFont.truetype(verdana_name, 65),
+        'rank_fnt': ImageFont.truetype(verdana_name, 29),
+        'RANK_fnt': ImageFont.truetype(verdana_name, 23),
+        'name_fnt': ImageFont.truetype('Roboto-Medium.ttf', 40)})
+    for template in _templates.values():
+        get_circle_mask(template.size)
+
+
+def get_template(style: str) -> Image.Image:
+    """Get a copy of a card template, loading it if it wasn't preloaded"""
+    if style not in _templates:
+        with Image.open(os.path.join(CARDS_MODELS_DIR, f'{style}.png')) as im:
+            _templates[style] = im.convert('RGBA')
+    return _templates[style].copy()
+
+
+def get_circle_mask(size: typing.Tuple[int, int]) -> np.ndarray:
+    """Get the boolean mask of the avatar circle for a card size, computed only once"""
+    if size not in _circle_masks:
+        ys, xs = np.ogrid[:size[1], :size[0]]
+        _circle_masks[size] = (xs-162)**2 + (ys-170)**2 < 139**2
+    return _circle_masks[size]
+
+
+def calc_pos(text: str, font, x: int, y: int, align: str = 'center'):
+    w, h = font.getsize(text)
+    if align == 'center':
+        return x-w/2, y-h/2
+    elif align == 'right':
+        return x-w, y-h/2
+
+
+def add_xp_bar(img: Image.Image, xp: int, needed_xp: int, color):
+    """Colorize the xp bar"""
+    error_rate = 25
+    data = np.array(img)   # "data" is a height x width x 4 numpy array
+    red, green, blue, alpha = data.T # Temporarily unpack the bands for readability
+
+    # Replace white with red... (leaves alpha values alone...)
+    white_areas = (abs(red)-180<error_rate) & (abs(blue)-180<error_rate) & (abs(green)-180<error_rate)
+    white_areas[:298] = False & False & False
+    max_x = round(298 + (980-298)*xp/needed_xp)
+    white_areas[max_x:] = False & False & False
+    #white_areas[298:980] = True & True & True
+    data[..., :-1][white_areas.T] = color # Transpose back needed
+    return Image.fromarray(data)
+
+
+def add_overlay(pfp: Image.Image, img: Image.Image, job: dict) -> Image.Image:
+    """Paste the avatar into a card template, then draw the xp bar and every text"""
+    xp, rank, txt, colors, levels_info = job['xp'], job['rank'], job['texts'], job['colors'], job['levels_info']
+    data = np.array(img)
+    mask = get_circle_mask(img.size)
+    # clear almost transparent pixels outside of the avatar
+    data[(data[..., 3] < 128) & ~mask] = (255,255,255,0)
+    # paste the avatar inside the circle, at the (20, 29) offset
+    avatar = np.zeros_like(data)
+    pfp_data = np.array(pfp.convert('RGBA'))[:data.shape[0]-29, :data.shape[1]-20]
+    avatar[29:29+pfp_data.shape[0], 20:20+pfp_data.shape[1]] = pfp_data
+    data[mask] = avatar[mask]
+    img = Image.fromarray(data)
+
+    img = add_xp_bar(img, xp-levels_info[2], levels_info[1]-levels_info[2], colors['bar'])
+    d = ImageDraw.Draw(img)
+    d.text(calc_pos(job['username'], _fonts['name_fnt'], 610, 68), job['username'], font=_fonts['name_fnt'], fill=colors['name'])
+    temp = '{} / {} xp ({}/{})'.format(xp-levels_info[2], levels_info[1]-levels_info[2], xp, levels_info[1])
+    d.text((calc_pos(temp, _fonts['xp_fnt'], 625, 237)), temp, font=_fonts['xp_fnt'], fill=colors['xp'])
+    d.text((380,140), txt[0], font=_fonts['NIVEAU_fnt'], fill=colors['NIVEAU'])
+    d.text((calc_pos(str(levels_info[0]), _fonts['levels_fnt'], 740, 160, 'right')), str(levels_info[0]), font=_fonts['levels_fnt'], fill=colors['xp'])
+    temp = '{x[0]}/{x[1]}'.format(x=rank)
+    d.text((calc_pos(txt[1], _fonts['RANK_fnt'], 893, 147, 'center')), txt[1], font=_fonts['RANK_fnt'], fill=colors['rank'])
+    d.text((calc_pos(temp, _fonts['rank_fnt'], 893, 180, 'center')), temp, font=_fonts['rank_fnt'], fill=colors['rank'])
+    return img
+
+
+def render_card(job: dict) -> bytes:
+    """Render a whole rank card and return the encoded PNG or GIF file
+    The job contains the avatar bytes, the card style, the xp, the levels info, the rank, the texts and the colors
+    Animated avatars can be reduced to a 'max_frames' number of frames"""
+    if len(_fonts) == 0:
+        init_worker()
+    pfp = Image.open(io.BytesIO(job['avatar']))
+    result = io.BytesIO()
+    if not job['animated']:
+        img = add_overlay(pfp.resize(size=(282,282)), get_template(job['style']), job)
+        img.save(result, format='png')
+        return result.getvalue()
+    template = get_template(job['style'])
+    durations, step, _ = gif_frames_info(pfp, job.get('max_frames'), extrema=False)
+
+    def render_frames():
+        for frame in iter_gif_frames(pfp, step):
+            img = add_overlay(frame.convert(mode='RGBA').resize(size=(282,282)), template.copy(), job)
+            yield ImageEnhance.Contrast(img).enhance(1.5).resize((800,265))
+
+    save_gif_frames(render_frames(), result, loop=0, duration=durations, subrectangles=True)
+    return result.getvalue()
+
+
+class CardRenderer:
+    """Render rank cards inside a pool of processes, so the bot loop never has to wait for them
+    At most `workers` cards are rendered at the same time, and at most `max_queue` others can wait"""
+
+    def __init__(self, workers: int = 2, max_queue: int = 10):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.pending = 0
+        self._semaphore: typing.Optional[asyncio.Semaphore] = None
+        self.executor = self._create_executor()
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker)
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # created lazily, to be bound to the running loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers)
+        return self._semaphore
+
+    async def render(self, job: dict) -> bytes:
+        """Render a card and return the encoded file
+        Raise RendererOverloaded if too many cards are already waiting"""
+        if self.pending >= self.workers + self.max_queue:
+            raise RendererOverloaded(f"{self.pending} rank cards are already waiting")
+        self.pending += 1
+        try:
+            async with self.semaphore:
+                try:
+                    return await asyncio.get_running_loop().run_in_executor(self.executor, render_card, job)
+                except BrokenProcessPool:
+                    # a worker died: start a fresh pool for the next cards
+                    self.executor.shutdown(wait=False)
+                    self.executor = self._create_executor()
+                    raise
+        finally:
+            self.pending -= 1
+
+    def close(self):
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,138 @@
+import typing
+from bisect import bisect_left, insort
+
+
+class RankIndex:
+    """Keep users sorted by decreasing xp, to get ranks and leaderboard pages without sorting everything
+
+    Users are stored in small sorted chunks of (-xp, userID) keys, and a Fenwick tree over the chunks sizes
+    gives the number of users before any chunk. Every operation is logarithmic (or close to it)."""
+
+    CHUNK_SIZE = 512
+
+    def __init__(self, items: typing.Iterable[typing.Tuple[int, float]] = ()):
+        self._xp: typing.Dict[int, float] = dict()
+        self._chunks: typing.List[list] = list()
+        self._maxes: list = list()
+        self._tree: typing.List[int] = [0]
+        self.load(items)
+
+    def load(self, items: typing.Iterable[typing.Tuple[int, float]]):
+        """Replace the whole index content by a list of (userID, xp) couples"""
+        self._xp = {user: xp for user, xp in items}
+        keys = sorted((-xp, user) for user, xp in self._xp.items())
+        self._chunks = [keys[i:i+self.CHUNK_SIZE] for i in range(0, len(keys), self.CHUNK_SIZE)]
+        self._rebuild()
+
+    def _rebuild(self):
+        """Recompute the chunks maximums and the Fenwick tree, after chunks were split or removed"""
+        self._maxes = [chunk[-1] for chunk in self._chunks]
+        size = len(self._chunks)
+        self._tree = [0] * (size+1)
+        for i, chunk in enumerate(self._chunks, start=1):
+            self._tree[i] += len(chunk)
+            parent = i + (i & -i)
+            if parent <= size:
+                self._tree[parent] += self._tree[i]
+
+    def _tree_add(self, index: int, value: int):
+        index += 1
+        while index < len(self._tree):
+            self._tree[index] += value
+            index += index & -index
+
+    def _tree_prefix(self, index: int) -> int:
+        """Number of users stored in the chunks before this index"""
+        total = 0
+        while index > 0:
+            total += self._tree[index]
+            index -= index & -index
+        return total
+
+    def _tree_find(self, position: int) -> typing.Tuple[int, int]:
+        """Get the chunk containing a position, and the position inside this chunk"""
+        index = 0
+        bit = 1 << (len(self._tree) - 1).bit_length()
+        while bit > 0:
+            nxt = index + bit
+            if nxt < len(self._tree) and self._tree[nxt] <= position:
+                index = nxt
+                position -= self._tree[nxt]
+            bit >>= 1
+        return index, position
+
+    def _insert(self, key: tuple):
+        if len(self._chunks) == 0:
+            self._chunks.append([key])
+            self._rebuild()
+            return
+        i = bisect_left(self._maxes, key)
+        if i == len(self._chunks):
+            i -= 1
+        chunk = self._chunks[i]
+        insort(chunk, key)
+        self._maxes[i] = chunk[-1]
+        if len(chunk) > self.CHUNK_SIZE * 2:
+            self._chunks[i:i+1] = [chunk[:self.CHUNK_SIZE], chunk[self.CHUNK_SIZE:]]
+            self._rebuild()
+        else:
+            self._tree_add(i, 1)
+
+    def _delete(self, key: tuple):
+        i = bisect_left(self._maxes, key)
+        chunk = self._chunks[i]
+        del chunk[bisect_left(chunk, key)]
+        if len(chunk) == 0:
+            del self._chunks[i]
+            self._rebuild()
+        else:
+            self._maxes[i] = chunk[-1]
+            self._tree_add(i, -1)
+
+    def __len__(self) -> int:
+        return len(self._xp)
+
+    def __contains__(self, userID: int) -> bool:
+        return userID in self._xp
+
+    def get(self, userID: int) -> typing.Optional[float]:
+        """Get the xp of a user, or None if they are not ranked"""
+        return self._xp.get(userID)
+
+    def set(self, userID: int, xp: float):
+        """Add a user, or update their xp"""
+        previous = self._xp.get(userID)
+        if previous == xp:
+            return
+        if previous is not None:
+            self._delete((-previous, userID))
+        self._xp[userID] = xp
+        self._insert((-xp, userID))
+
+    def rank(self, userID: int) -> typing.Optional[int]:
+        """Get the rank of a user (starting from 1), or None if they are not ranked"""
+        xp = self._xp.get(userID)
+        if xp is None:
+            return None
+        key = (-xp, userID)
+        i = bisect_left(self._maxes, key)
+        return self._tree_prefix(i) + bisect_left(self._chunks[i], key) + 1
+
+    def iter_from(self, start: int = 0) -> typing.Iterator[typing.Tuple[int, float]]:
+        """Iterate over (userID, xp) couples by decreasing xp, starting from a position"""
+        if start >= len(self):
+            return
+        i, pos = self._tree_find(max(start, 0))
+        for chunk in self._chunks[i:]:
+            for neg_xp, user in chunk[pos:]:
+                yield user, -neg_xp
+            pos = 0
+
+    def page(self, start: int, count: int) -> typing.List[typing.Tuple[int, float]]:
+        """Get the (userID, xp) couples from a position, by decreasing xp"""
+        result = list()
+        for item in self.iter_from(start):
+            if len(result) >= count:
+                break
+            result.append(item)
+        return result
@@ -0,0 +1,61 @@
+import hashlib
+import re
+import typing
+
+import feedparser
+from feedparser.util import FeedParserDict
+
+WEB_IMAGE_REGEX = re.compile(r'(http(s?):)([/|.|\w|\s|-])*\.(?:jpe?g|gif|png|webp)')
+TWITCH_IMAGE_REGEX = re.compile(r'<img src="([^"]+)" />')
+# entries fields used to create the rss messages
+ENTRY_KEYS = ('link', 'title', 'author', 'published_parsed', 'published', 'updated_parsed')
+# feed fields used to create the rss messages
+FEED_KEYS = ('link', 'title', 'author')
+
+
+def entry_image(entry: FeedParserDict, kind: str) -> typing.Optional[str]:
+    """Find the image url of an entry, depending on the kind of feed"""
+    if kind == 'yt':
+        if 'media_thumbnail' in entry.keys() and len(entry['media_thumbnail']) > 0:
+            return entry['media_thumbnail'][0]['url']
+        return None
+    if kind == 'twitch':
+        r = TWITCH_IMAGE_REGEX.search(entry.get('summary', ''))
+        return None if r is None else r.group(1)
+    if kind == 'deviant':
+        if 'media_content' in entry.keys() and len(entry['media_content']) > 0:
+            return entry['media_content'][0]['url']
+        return None
+    r = WEB_IMAGE_REGEX.search(str(entry))
+    return None if r is None else r.group(0)
+
+
+def entry_key(entry: FeedParserDict) -> typing.Optional[str]:
+    """A short hash identifying an entry, from its GUID or its link"""
+    value = entry.get('id') or entry.get('link')
+    if not value:
+        value = entry.get('title', '') + entry.get('published', '')
+    if not value:
+        return None
+    return hashlib.sha1(value.encode()).hexdigest()[:16]
+
+
+def parse_feed(text: str, headers: dict, kind: str = 'web') -> FeedParserDict:
+    """Parse a feed and keep only the compact records needed by the rss messages (link, title, author, dates, image and key)
+    Made to run in a worker process: the result is small and quick to send back"""
+    feed = feedparser.parse(text, response_headers=headers)
+    result = FeedParserDict(entries=[], feed=FeedParserDict())
+    for key in FEED_KEYS:
+        if key in feed.feed.keys():
+            result.feed[key] = feed.feed[key]
+        if key in feed.keys():
+            result[key] = feed[key]
+    if 'bozo_exception' in feed.keys():
+        result['bozo'] = feed['bozo']
+        result['bozo_exception'] = str(feed['bozo_exception'])
+    for entry in feed.entries:
+        record = FeedParserDict({key: entry[key] for key in ENTRY_KEYS if key in entry.keys()})
+        record['image'] = entry_image(entry, kind)
+        record['key'] = entry_key(entry)
+        result.entries.append(record)
+    return result
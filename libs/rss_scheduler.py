@@ -0,0 +1,106 @@
+import heapq
+import statistics
+import time
+import typing
+
+
+class FlowsScheduler:
+    """Decide when each rss flow should be checked again, from the publication frequency learned from its entries dates
+    Active flows are checked every `min_interval`, dormant ones less and less often, and failing ones with an exponential backoff"""
+
+    def __init__(self, min_interval: int = 300, default_interval: int = 1200, max_interval: int = 4*3600, ratio: float = 0.25, history: int = 10):
+        self.min_interval = min_interval # seconds
+        self.default_interval = default_interval # seconds, used when the activity of a flow is unknown
+        self.max_interval = max_interval # seconds
+        self.ratio = ratio # part of the expected time between two publications waited between two checks
+        self.history = history # publication dates kept per flow
+        self.flows: typing.Dict[int, dict] = dict() # flow ID -> next check date, errors count, last publications dates
+        self.heap: typing.List[typing.Tuple[float, int]] = list()
+
+    def load(self, data: typing.Dict[str, dict]):
+        """Restore the flows states saved with `dump`"""
+        for flow_id, state in data.items():
+            self.flows[int(flow_id)] = state
+            heapq.heappush(self.heap, (state['next'], int(flow_id)))
+
+    def dump(self) -> typing.Dict[str, dict]:
+        return {str(flow_id): state for flow_id, state in self.flows.items()}
+
+    def _state(self, flow_id: int) -> dict:
+        return self.flows.setdefault(flow_id, {'next': 0, 'errors': 0, 'pubs': [], 'last': None})
+
+    def _schedule(self, flow_id: int, date: float):
+        self._state(flow_id)['next'] = date
+        heapq.heappush(self.heap, (date, flow_id))
+
+    def sync(self, flow_ids: typing.Iterable[int]):
+        """Forget the deleted flows, and schedule the new ones right now"""
+        flow_ids = set(flow_ids)
+        for flow_id in [x for x in self.flows if x not in flow_ids]:
+            del self.flows[flow_id]
+        now = time.time()
+        for flow_id in flow_ids - self.flows.keys():
+            self._schedule(flow_id, now)
+
+    def pop_due(self, now: typing.Optional[float] = None) -> typing.List[int]:
+        """Get the flows which should be checked now
+        They must be given back to `reschedule` once checked"""
+        now = now or time.time()
+        due = list()
+        while len(self.heap) > 0 and self.heap[0][0] <= now:
+            date, flow_id = heapq.heappop(self.heap)
+            state = self.flows.get(flow_id)
+            # outdated entry: the flow was deleted or rescheduled since
+            if state is None or state['next'] != date:
+                continue
+            due.append(flow_id)
+        return due
+
+    def add_publications(self, flow_id: int, dates: typing.Iterable[float]):
+        """Remember the publication dates (timestamps) of the entries found in a flow"""
+        state = self._state(flow_id)
+        state['pubs'] = sorted(set(state['pubs']).union(dates))[-self.history:]
+
+    def interval(self, state: dict, now: float) -> float:
+        """Time to wait between two checks of a flow, from its publication frequency"""
+        last = max(state['pubs'][-1:] + [state['last'] or 0])
+        if last == 0:
+            return self.default_interval
+        idle = max(now - last, 0)
+        # a flow silent for longer than usual is probably slowing down
+        expected = idle
+        if len(state['pubs']) >= 2:
+            expected = max(statistics.median(b - a for a, b in zip(state['pubs'], state['pubs'][1:])), idle)
+        return min(max(expected * self.ratio, self.min_interval), self.max_interval)
+
+    def reschedule(self, flow_id: int, success: typing.Optional[bool], last_publication: typing.Optional[float] = None, learn: bool = True) -> float:
+        """Schedule the next check of a flow
+        success is False if the check failed, None if it was skipped
+        If learn is False (the flow has no publication dates), the default interval is used
+        Return the delay before the next check"""
+        now = time.time()
+        state = self._state(flow_id)
+        if not learn:
+            state['pubs'], state['last'] = [], None
+        elif last_publication is not None:
+            state['last'] = max(state['last'] or 0, last_publication)
+        if success is None:
+            delay = self.min_interval
+        elif success:
+            state['errors'] = 0
+            delay = self.interval(state, now)
+        else:
+            state['errors'] += 1
+            delay = min(self.interval(state, now) * 2 ** min(state['errors'], 10), self.max_interval)
+        self._schedule(flow_id, now + delay)
+        return delay
+
+    def next_check(self) -> typing.Optional[float]:
+        """Date of the next planned check, if any"""
+        while len(self.heap) > 0:
+            date, flow_id = self.heap[0]
+            state = self.flows.get(flow_id)
+            if state is not None and state['next'] == date:
+                return date
+            heapq.heappop(self.heap)
+        return None
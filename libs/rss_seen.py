@@ -0,0 +1,46 @@
+import collections
+import typing
+
+
+class SeenEntries:
+    """Remember the entries already sent by each rss flow, as short hashes of their GUID or link (see libs.rss_parsing)
+    Each flow keeps a bounded ring of hashes, so the memory used doesn't grow with the feeds history"""
+
+    def __init__(self, size: int = 300):
+        self.size = size # max entries remembered per flow
+        self.flows: typing.Dict[int, typing.Tuple[typing.Deque[str], typing.Set[str]]] = dict()
+
+    def known(self, flow_id: int) -> bool:
+        """Check if a flow has a history, otherwise its entries can't be compared"""
+        return flow_id in self.flows
+
+    def seen(self, flow_id: int, key: str) -> bool:
+        return key in self.flows[flow_id][1] if flow_id in self.flows else False
+
+    def add(self, flow_id: int, keys: typing.Iterable[str]) -> bool:
+        """Remember some entries of a flow, from the oldest to the newest
+        Return True if the history of the flow changed"""
+        ring, keys_set = self.flows.setdefault(flow_id, (collections.deque(), set()))
+        changed = False
+        for key in keys:
+            if key is None or key in keys_set:
+                continue
+            ring.append(key)
+            keys_set.add(key)
+            changed = True
+            if len(ring) > self.size:
+                keys_set.discard(ring.popleft())
+        return changed
+
+    def forget(self, flow_id: int):
+        self.flows.pop(flow_id, None)
+
+    def load(self, flow_id: int, data: str):
+        """Restore the history of a flow saved with `dump`"""
+        self.add(flow_id, data.split())
+
+    def dump(self, flow_id: int) -> typing.Optional[str]:
+        """Get the history of a flow as a short text, to save it with the flow"""
+        if flow_id not in self.flows:
+            return None
+        return ' '.join(self.flows[flow_id][0])
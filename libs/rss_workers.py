@@ -0,0 +1,142 @@
+import asyncio
+import itertools
+import multiprocessing
+import threading
+import typing
+import zlib
+
+import aiohttp
+import async_timeout
+from aiohttp import client_exceptions
+
+from libs.rss_parsing import parse_feed
+
+# errors meaning that the feed is unreachable, not that something went wrong in the bot
+FETCH_ERRORS = (client_exceptions.ClientConnectorCertificateError, UnicodeDecodeError, client_exceptions.TooManyRedirects,
+                client_exceptions.ClientConnectorError, client_exceptions.ClientPayloadError)
+
+
+async def fetch_feed(session: aiohttp.ClientSession, url: str, timeout: int, request_headers: dict) -> tuple:
+    """Download a feed
+    Return ('ok', headers, size, text), ('not_modified',), ('error',) or ('timeout',)"""
+    try:
+        async with async_timeout.timeout(timeout):
+            async with session.get(url, headers=request_headers) as response:
+                if response.status == 304:
+                    return ('not_modified',)
+                size = len(await response.read())
+                text = await response.text()
+                raw_headers = response.raw_headers
+    except FETCH_ERRORS:
+        return ('error',)
+    except asyncio.TimeoutError:
+        return ('timeout',)
+    headers = {k.decode("utf-8").lower(): v.decode("utf-8") for k, v in raw_headers}
+    return ('ok', headers, size, text)
+
+
+async def _run_job(session: aiohttp.ClientSession, job: tuple, results: multiprocessing.Queue, semaphore: asyncio.Semaphore):
+    job_id, url, timeout, request_headers, kind = job
+    try:
+        result = await fetch_feed(session, url, timeout, request_headers)
+        if result[0] == 'ok':
+            result = ('ok', result[1], result[2], parse_feed(result[3], result[1], kind))
+    except client_exceptions.InvalidURL:
+        result = ('invalid_url',)
+    except Exception as e:
+        result = ('exception', f"{type(e).__name__}: {e}")
+    finally:
+        semaphore.release()
+    results.put((job_id, result))
+
+
+async def _worker_loop(jobs: multiprocessing.Queue, results: multiprocessing.Queue, max_concurrent: int):
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(max_concurrent)
+    tasks = set()
+    async with aiohttp.ClientSession() as session:
+        while True:
+            job = await loop.run_in_executor(None, jobs.get)
+            if job is None:
+                break
+            await semaphore.acquire()
+            task = asyncio.ensure_future(_run_job(session, job, results, semaphore))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+
+def worker_main(jobs: multiprocessing.Queue, results: multiprocessing.Queue, max_concurrent: int):
+    """Entry point of a worker process: download and parse the feeds sent by the bot, until a None job is received"""
+    asyncio.run(_worker_loop(jobs, results, max_concurrent))
+
+
+class FeedWorkers:
+    """Processes downloading and parsing the rss feeds, each with its own event loop and HTTP connections
+    Feeds are partitioned by a hash of their url, so a feed is always handled by the same worker,
+    and parsed feeds are sent back to the bot through a local queue"""
+
+    def __init__(self, workers: int = 2, max_concurrent: int = 10, grace_delay: int = 10):
+        self.max_concurrent = max_concurrent # max feeds downloaded at the same time by one worker
+        self.grace_delay = grace_delay # seconds to wait for a result after the request timeout, in case the worker died
+        self.context = multiprocessing.get_context('spawn')
+        self.results = self.context.Queue()
+        self.processes: typing.List[typing.Optional[multiprocessing.Process]] = [None] * workers
+        self.jobs: typing.List[typing.Optional[multiprocessing.Queue]] = [None] * workers
+        self.futures: typing.Dict[int, asyncio.Future] = dict()
+        self._ids = itertools.count()
+        self._reader: typing.Optional[threading.Thread] = None
+
+    def partition(self, url: str) -> int:
+        """Get the worker which handles a feed"""
+        return zlib.crc32(url.encode()) % len(self.processes)
+
+    def _get_jobs_queue(self, index: int) -> multiprocessing.Queue:
+        """Get the jobs queue of a worker, starting it again if needed"""
+        process = self.processes[index]
+        if process is None or not process.is_alive():
+            self.jobs[index] = self.context.Queue()
+            process = self.context.Process(target=worker_main, args=(self.jobs[index], self.results, self.max_concurrent), name=f"rss-worker-{index}", daemon=True)
+            process.start()
+            self.processes[index] = process
+        return self.jobs[index]
+
+    def _read_results(self, loop: asyncio.AbstractEventLoop):
+        """Give the results of the workers to the bot loop, from a dedicated thread, until `close` is called"""
+        while True:
+            item = self.results.get()
+            if item is None:
+                break
+            try:
+                loop.call_soon_threadsafe(self._set_result, *item)
+            except RuntimeError:
+                # the loop is closed
+                break
+
+    def _set_result(self, job_id: int, result: tuple):
+        future = self.futures.get(job_id)
+        if future is not None and not future.done():
+            future.set_result(result)
+
+    async def fetch(self, url: str, timeout: int, request_headers: dict, kind: str, partition_key: str = None) -> tuple:
+        """Download and parse a feed in its worker
+        Return ('ok', headers, size, feed), ('not_modified',), ('error',), ('timeout',), ('invalid_url',) or ('exception', description)"""
+        if self._reader is None or not self._reader.is_alive():
+            self._reader = threading.Thread(target=self._read_results, args=(asyncio.get_running_loop(),), name="rss-results", daemon=True)
+            self._reader.start()
+        job_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self.futures[job_id] = future
+        try:
+            self._get_jobs_queue(self.partition(partition_key or url)).put((job_id, url, timeout, request_headers, kind))
+            return await asyncio.wait_for(future, timeout + self.grace_delay)
+        except asyncio.TimeoutError:
+            return ('timeout',)
+        finally:
+            del self.futures[job_id]
+
+    def close(self):
+        """Stop every worker and the results reader"""
+        for process, jobs in zip(self.processes, self.jobs):
+            if process is not None and process.is_alive():
+                jobs.put(None)
+        self.results.put(None)
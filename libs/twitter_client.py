@@ -0,0 +1,124 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import secrets
+import time
+import typing
+from urllib.parse import quote
+
+import aiohttp
+import twitter
+from yarl import URL
+
+
+def _quote(value) -> str:
+    """Percent-encode a value as required by OAuth 1.0"""
+    if isinstance(value, bool):
+        value = 'true' if value else 'false'
+    return quote(str(value), safe='')
+
+
+class AsyncTwitter:
+    """Asynchronous client for the few Twitter API endpoints used by the rss flows
+    Requests share one connection pool, screen names are cached by user ID, and rate limits are respected
+    Results are python-twitter models, and errors are python-twitter TwitterError, like with twitter.Api"""
+
+    API_URL = 'https://api.twitter.com/1.1/'
+    RATE_LIMIT_CODE = 88
+
+    def __init__(self, consumer_key: str, consumer_secret: str, access_token_key: str, access_token_secret: str,
+                 timeout: int = 15, max_rate_limit_wait: int = 10, names_ttl: int = 86400):
+        self.consumer_key = consumer_key
+        self.consumer_secret = consumer_secret
+        self.access_token_key = access_token_key
+        self.access_token_secret = access_token_secret
+        self.timeout = timeout # seconds
+        self.max_rate_limit_wait = max_rate_limit_wait # max seconds to wait for a rate limit reset, instead of failing
+        self.names_ttl = names_ttl # seconds
+        self.rate_limits: typing.Dict[str, typing.Tuple[int, float]] = dict() # endpoint -> remaining requests, reset date
+        self.screen_names: typing.Dict[int, typing.Tuple[float, str]] = dict() # user ID -> date, screen name
+        self._session: typing.Optional[aiohttp.ClientSession] = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    def _oauth_header(self, method: str, url: str, params: dict) -> str:
+        """Sign a request with the OAuth 1.0a user context"""
+        oauth = {
+            'oauth_consumer_key': self.consumer_key,
+            'oauth_nonce': secrets.token_hex(16),
+            'oauth_signature_method': 'HMAC-SHA1',
+            'oauth_timestamp': str(int(time.time())),
+            'oauth_token': self.access_token_key,
+            'oauth_version': '1.0',
+        }
+        encoded = sorted((_quote(k), _quote(v)) for k, v in {**params, **oauth}.items())
+        base = '&'.join((method, _quote(url), _quote('&'.join(f'{k}={v}' for k, v in encoded))))
+        key = f'{_quote(self.consumer_secret)}&{_quote(self.access_token_secret)}'
+        oauth['oauth_signature'] = base64.b64encode(hmac.new(key.encode(), base.encode(), hashlib.sha1).digest()).decode()
+        return 'OAuth ' + ', '.join(f'{_quote(k)}="{_quote(v)}"' for k, v in sorted(oauth.items()))
+
+    async def _wait_rate_limit(self, endpoint: str):
+        """Wait for the rate limit reset if it's close, or raise a TwitterError (code 88)"""
+        remaining, reset = self.rate_limits.get(endpoint, (1, 0))
+        delay = reset - time.time()
+        if remaining > 0 or delay <= 0:
+            return
+        if delay > self.max_rate_limit_wait:
+            raise twitter.TwitterError([{'code': self.RATE_LIMIT_CODE, 'message': f'Rate limit exceeded for {delay:.0f}s'}])
+        await asyncio.sleep(delay)
+
+    async def _request(self, endpoint: str, **params):
+        params = {k: v for k, v in params.items() if v is not None}
+        await self._wait_rate_limit(endpoint)
+        url = self.API_URL + endpoint + '.json'
+        query = '&'.join(f'{_quote(k)}={_quote(v)}' for k, v in params.items())
+        headers = {'Authorization': self._oauth_header('GET', url, params)}
+        async with self.session.get(URL(f'{url}?{query}', encoded=True), headers=headers) as resp:
+            if 'x-rate-limit-remaining' in resp.headers:
+                self.rate_limits[endpoint] = (int(resp.headers['x-rate-limit-remaining']), float(resp.headers['x-rate-limit-reset']))
+            try:
+                data = await resp.json(content_type=None)
+            except ValueError:
+                data = None
+            if isinstance(data, dict) and 'error' in data:
+                raise twitter.TwitterError(data['error'])
+            if isinstance(data, dict) and 'errors' in data:
+                raise twitter.TwitterError(data['errors'])
+            if resp.status >= 400 or data is None:
+                raise twitter.TwitterError([{'code': resp.status, 'message': resp.reason}])
+            return data
+
+    def _remember_user(self, user: twitter.User):
+        if user is not None and user.id is not None and user.screen_name is not None:
+            self.screen_names[user.id] = (time.time(), user.screen_name)
+
+    async def get_user_timeline(self, user_id: int = None, screen_name: str = None, exclude_replies: bool = False,
+                                trim_user: bool = False, count: int = None) -> typing.List[twitter.Status]:
+        """Get the last tweets of a user"""
+        data = await self._request('statuses/user_timeline', user_id=user_id, screen_name=screen_name, exclude_replies=exclude_replies,
+                                   trim_user=trim_user, count=count, tweet_mode='extended')
+        posts = [twitter.Status.NewFromJsonDict(x) for x in data]
+        if not trim_user and len(posts) > 0:
+            self._remember_user(posts[0].user)
+        return posts
+
+    async def get_user(self, user_id: int = None, screen_name: str = None) -> twitter.User:
+        user = twitter.User.NewFromJsonDict(await self._request('users/show', user_id=user_id, screen_name=screen_name))
+        self._remember_user(user)
+        return user
+
+    async def get_screen_name(self, user_id: int) -> str:
+        """Get the screen name of a user from its ID, requesting it only once a day"""
+        date, name = self.screen_names.get(user_id, (0, None))
+        if date + self.names_ttl > time.time():
+            return name
+        return (await self.get_user(user_id=user_id)).screen_name
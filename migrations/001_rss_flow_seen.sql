@@ -0,0 +1,4 @@
+-- Last entries sent by each rss flow (space-separated hashes, see libs/rss_seen.py)
+-- Used by fcts/rss.py to avoid sending an entry twice, even if its date or link changes
+ALTER TABLE `rss_flow` ADD `seen` TEXT NULL DEFAULT NULL;
+ALTER TABLE `rss_flow_beta` ADD `seen` TEXT NULL DEFAULT NULL;
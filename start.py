@@ -122,6 +122,8 @@ def main():
     if client.database_online:
         client.connect_database_frm()
         client.connect_database_xp()
+    # the pools connect lazily, so they can be created even if the database is offline for now
+    client.connect_database_pools()
 
     client.dbl_token = tokens.get_dbl_token()
 
@@ -0,0 +1,47 @@
+import io
+import os
+
+import numpy as np
+import pytest
+from PIL import Image, ImageSequence
+
+from libs import blurple, halloween
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# the expected images were made by the filters before their NumPy rewrite
+CASES = [(lib, modifier, method, ext)
+         for lib in (blurple, halloween)
+         for modifier in ('light', 'dark')
+         for method in lib.METHODS
+         for ext in ('png', 'gif')]
+
+
+def read_fixture(*path: str) -> bytes:
+    with open(os.path.join(FIXTURES, *path), 'rb') as f:
+        return f.read()
+
+def decode_frames(data: bytes):
+    with Image.open(io.BytesIO(data)) as img:
+        return [(np.array(frame.convert('RGBA')), frame.info.get('duration')) for frame in ImageSequence.Iterator(img)]
+
+
+@pytest.mark.parametrize("lib,modifier,method,ext", CASES,
+                         ids=[f"{lib.__name__.split('.')[-1]}-{modifier}{method}-{ext}" for lib, modifier, method, ext in CASES])
+def test_convert_image(lib, modifier, method, ext):
+    result = lib.convert_image(read_fixture(f"input.{ext}"), modifier, method, [None])
+    assert result.filename == f"{modifier}.{ext}"
+    frames = decode_frames(result.data)
+    expected = decode_frames(read_fixture(lib.__name__.split('.')[-1], f"{modifier}{method}.{ext}"))
+    assert len(frames) == len(expected)
+    for (frame, duration), (expected_frame, expected_duration) in zip(frames, expected):
+        assert duration == expected_duration
+        np.testing.assert_array_equal(frame, expected_frame)
+
+
+@pytest.mark.parametrize("lib", [blurple, halloween])
+def test_convert_image_max_frames(lib):
+    result = lib.convert_image(read_fixture("input.gif"), 'light', '--filter', [None], 2)
+    frames = decode_frames(result.data)
+    # one frame out of two is kept, and lasts for both
+    assert [duration for _, duration in frames] == [160, 80]
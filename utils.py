@@ -4,7 +4,11 @@ import logging
 import sys
 import time
 import mysql
+import aiohttp
 from typing import Any, Callable, Optional, Coroutine
+from libs.assets_cache import AssetsCache
+from libs.db_pool import DatabaseManager
+from libs.image_jobs import ImageJobQueue
 
 
 OUTAGE_REASON = {
@@ -88,7 +92,11 @@ class zbot(commands.bot.AutoShardedBot):
         self.database_keys = dict() # credentials for the database
         self.log = logging.getLogger("runner") # logs module
         self.dbl_token = dbl_token # token for Discord Bot List
-        self._cnx = [[None, 0], [None, 0], [None, 0]] # database connections
+        self._cnx = [[None, 0], [None, 0]] # database connections
+        self.db: Optional[DatabaseManager] = None # async database pools
+        self._http_session: Optional[aiohttp.ClientSession] = None # shared HTTP client
+        self.assets_cache = AssetsCache(ttl=600, max_size=64*1024**2) # downloaded images
+        self.image_jobs = ImageJobQueue(workers=2, per_guild=1, timeout=60) # image filters processes
         self.xp_enabled: bool = True # if xp is enabled
         self.rss_enabled: bool = True # if rss is enabled
         self.alerts_enabled: bool = True # if alerts system is enabled
@@ -170,30 +178,39 @@ class zbot(commands.bot.AutoShardedBot):
         else:
             raise ValueError(dict)
     
-    @property
-    def cnx_stats(self) -> mysql.connector.connection.MySQLConnection:
-        """Connection to the xp database
-        Used for guilds using local xp (1 table per guild)"""
-        if self._cnx[2][1] + 1260 < round(time.time()):  # 21min
-            self.connect_database_stats()
-            self._cnx[2][1] = round(time.time())
-            return self._cnx[2][0]
-        else:
-            return self._cnx[2][0]
-
-    def connect_database_stats(self):
+    def connect_database_pools(self):
+        """Create the async connections pools, used with `async with bot.db.acquire()`
+        No connection is made until a pool is used, and the previous pools are closed"""
         if len(self.database_keys) > 0:
-            if self._cnx[2][0] is not None:
-                self._cnx[2][0].close()
-            self.log.debug('Connection à MySQL (user {})'.format(
-                self.database_keys['user']))
-            self._cnx[2][0] = mysql.connector.connect(user=self.database_keys['user'], password=self.database_keys['password'],
-                                                      host=self.database_keys['host'], database='statsbot',
-                                                      buffered=True)
-            self._cnx[2][1] = round(time.time())
+            if self.db is not None:
+                self.db.close()
+            self.db = DatabaseManager(self.database_keys, log=self.log)
         else:
             raise ValueError(dict)
 
+    @property
+    def http_session(self) -> aiohttp.ClientSession:
+        """Long-lived HTTP client shared by the whole bot, to reuse its connections pool"""
+        if self._http_session is None or self._http_session.closed:
+            self._http_session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30, connect=10),
+                                                       headers={'User-Agent': 'Mozilla/5.0'})
+        return self._http_session
+
+    async def fetch_asset(self, url) -> bytes:
+        """Download an image (avatar, emoji, attachment...), using the assets cache"""
+        return await self.assets_cache.fetch(self.http_session, str(url))
+
+    async def close(self):
+        if xp_cog := self.get_cog("Xp"):
+            # write pending xp before losing it
+            await xp_cog.bdd_flush_xp()
+        await super().close()
+        if self._http_session is not None:
+            await self._http_session.close()
+        self.image_jobs.close()
+        if self.db is not None:
+            self.db.close()
+
     async def user_avatar_as(self, user: discord.User, size: int = 512) -> discord.Asset:
         """Get the avatar of an user, format gif or png (as webp isn't supported by some browsers)"""
         if not isinstance(user, (discord.User, discord.Member, discord.ClientUser)):